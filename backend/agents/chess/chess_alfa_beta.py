@@ -7,112 +7,275 @@ import random
 import chess
 from chess import polyglot
 from backend.adapter import AgentAdapter, Player
+from backend.agents.transposition import TranspositionTable, EXACT, LOWER, UPPER
+from backend.agents.time_control import TimeControl, SearchTimeout
+
+# Own moves a game clock is expected to last for
+MOVES_LEFT = 40
+
+MATE_SCORE = 10000
+
+# Scores beyond this are mates, the table keeps them relative to the node
+MATE_BOUND = MATE_SCORE - 1000
+
+# Polyglot Zobrist keys, the position key matches polyglot.zobrist_hash
+ZOBRIST = polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_TURN = ZOBRIST[780]
+
+# Castling right of the rook starting on the square
+ZOBRIST_CASTLING = [
+    (chess.BB_H1, ZOBRIST[768]),
+    (chess.BB_A1, ZOBRIST[769]),
+    (chess.BB_H8, ZOBRIST[770]),
+    (chess.BB_A8, ZOBRIST[771])
+]
+
+# Captured piece values for ordering captures after the hash move
+CAPTURE_ORDER = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0
+}
+
+PIECE_WEIGHTS = [
+    (chess.PAWN, 1),
+    (chess.KNIGHT, 3),
+    (chess.BISHOP, 3),
+    (chess.ROOK, 5),
+    (chess.QUEEN, 9)
+]
+
+# King on these squares counts as safe
+KING_SHELTER = {
+    chess.WHITE: chess.BB_FILE_A | chess.BB_FILE_H | chess.BB_RANK_1,
+    chess.BLACK: chess.BB_FILE_A | chess.BB_FILE_H | chess.BB_RANK_8
+}
+
+
+def mobility(board: chess.Board, color: chess.Color) -> int:
+    """Pseudo-legal mobility: attacked squares not occupied by own pieces"""
+    occupied = board.occupied
+    own = board.occupied_co[color]
+    enemy = board.occupied_co[not color]
+    free = ~own & chess.BB_ALL
+    count = 0
+
+    for sq in chess.scan_forward(board.knights & own):
+        count += (chess.BB_KNIGHT_ATTACKS[sq] & free).bit_count()
+
+    for sq in chess.scan_forward((board.bishops | board.queens) & own):
+        count += (chess.BB_DIAG_ATTACKS[sq][chess.BB_DIAG_MASKS[sq] & occupied] & free).bit_count()
+
+    for sq in chess.scan_forward((board.rooks | board.queens) & own):
+        attacks = (chess.BB_RANK_ATTACKS[sq][chess.BB_RANK_MASKS[sq] & occupied] |
+                   chess.BB_FILE_ATTACKS[sq][chess.BB_FILE_MASKS[sq] & occupied])
+        count += (attacks & free).bit_count()
+
+    for sq in chess.scan_forward(board.kings & own):
+        count += (chess.BB_KING_ATTACKS[sq] & free).bit_count()
+
+    # Single pushes and captures of all pawns at once
+    pawns = board.pawns & own
+
+    if color == chess.WHITE:
+        pushes = (pawns << 8) & ~occupied & chess.BB_ALL
+        west = (pawns << 7) & ~chess.BB_FILE_H & enemy
+        east = (pawns << 9) & ~chess.BB_FILE_A & enemy
+    else:
+        pushes = (pawns >> 8) & ~occupied
+        west = (pawns >> 9) & ~chess.BB_FILE_H & enemy
+        east = (pawns >> 7) & ~chess.BB_FILE_A & enemy
+
+    return count + pushes.bit_count() + west.bit_count() + east.bit_count()
+
+
+def doubled_pawns(pawns: int) -> int:
+    """Pawns standing behind another pawn of the same color on a file"""
+    res = 0
+
+    for file_mask in chess.BB_FILES:
+        n = (pawns & file_mask).bit_count()
+
+        if n > 1:
+            res += n - 1
+
+    return res
+
+
+def piece_key(piece_type: chess.PieceType, color: chess.Color, square: chess.Square) -> int:
+    """Zobrist key of a piece on a square"""
+    return ZOBRIST[64 * (2 * (piece_type - 1) + color) + square]
+
+
+def castling_key(board: chess.Board) -> int:
+    """Zobrist key of the castling rights"""
+    rights = board.clean_castling_rights()
+    key = 0
+
+    for rook, zobrist in ZOBRIST_CASTLING:
+        if rights & rook:
+            key ^= zobrist
+
+    return key
+
+
+def ep_key(board: chess.Board) -> int:
+    """Zobrist key of the en passant file, only when a pawn can capture there"""
+    ep = board.ep_square
+
+    if ep is None:
+        return 0
+
+    if board.turn == chess.WHITE:
+        mask = chess.shift_down(chess.BB_SQUARES[ep])
+    else:
+        mask = chess.shift_up(chess.BB_SQUARES[ep])
+
+    mask = chess.shift_left(mask) | chess.shift_right(mask)
+
+    if mask & board.pawns & board.occupied_co[board.turn]:
+        return ZOBRIST[772 + chess.square_file(ep)]
+
+    return 0
+
+
+def move_key(board: chess.Board, move: chess.Move) -> int:
+    """
+    Change of the Zobrist key when the move is pushed, less the castling
+    and en passant keys of the new position
+    """
+    color = board.turn
+    src, dst = move.from_square, move.to_square
+    piece_type = board.piece_type_at(src)
+    key = castling_key(board) ^ ep_key(board) ^ ZOBRIST_TURN ^ piece_key(piece_type, color, src)
+
+    if piece_type == chess.KING and board.is_castling(move):
+        rank = chess.square_rank(src)
+
+        if board.is_kingside_castling(move):
+            king, rook, rook_to = chess.square(6, rank), chess.square(7, rank), chess.square(5, rank)
+        else:
+            king, rook, rook_to = chess.square(2, rank), chess.square(0, rank), chess.square(3, rank)
+
+        return (key ^ piece_key(chess.KING, color, king) ^
+                piece_key(chess.ROOK, color, rook) ^ piece_key(chess.ROOK, color, rook_to))
+
+    victim = board.piece_type_at(dst)
+
+    if victim is not None:
+        key ^= piece_key(victim, not color, dst)
+    elif piece_type == chess.PAWN and dst == board.ep_square:
+        key ^= piece_key(chess.PAWN, not color, dst - 8 if color == chess.WHITE else dst + 8)
+
+    return key ^ piece_key(move.promotion or piece_type, color, dst)
+
+
+def score_to_tt(score, ply: int):
+    """Mate distance counted from the root -> counted from the node"""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+
+    return score
+
+
+def score_from_tt(score, ply: int):
+    """Mate distance counted from the node -> counted from the root"""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+
+    return score
 
 
 class ChessRandomAgent(AgentAdapter):
-    def __init__(self):
+    def __init__(self, move_time=1.0, game_time=None, max_depth=32):
         """Agent constructor"""
         self.board: chess.Board = chess.Board()
         self.my_player: chess.Color = chess.WHITE
+        self.tt = TranspositionTable()
+        self.clock = TimeControl(move_time, game_time)
+        self.max_depth = max_depth
+        self.nodes = 0
+        # Length of the move stack when the search started
+        self.root_ply = 0
+        # Zobrist key of the board and the keys before the moves on its stack
+        self.key = 0
+        self.keys = []
         self.reset()
         self.book_reader = polyglot.open_reader('../data/Cerebellum3Merge.bin')
 
     def evaluate(self) -> int:
-        """Evaluate the board using heuristic function"""
+        """Evaluate the board using heuristic function on bitboards"""
         board = self.board
+        white = board.occupied_co[chess.WHITE]
+        black = board.occupied_co[chess.BLACK]
 
         # 1. Material
-        PIECE_WEIGHTS = {
-            chess.PAWN: 1,
-            chess.KNIGHT: 3,
-            chess.BISHOP: 3,
-            chess.ROOK: 5,
-            chess.QUEEN: 9,
-            chess.KING: 0
-        }
-
-        # 2. Position (centre is good)
-        POSITION_SQUARES = [
-            0, 0, 1, 2, 2, 1, 0, 0,
-            0, 2, 3, 4, 4, 3, 2, 0,
-            1, 3, 5, 6, 6, 5, 3, 1,
-            2, 4, 6, 8, 8, 6, 4, 2,
-            2, 4, 6, 8, 8, 6, 4, 2,
-            1, 3, 5, 6, 6, 5, 3, 1,
-            0, 2, 3, 4, 4, 3, 2, 0,
-            0, 0, 1, 2, 2, 1, 0, 0
-        ]
-
-        material_white = 0
-        material_black = 0
-        pos_white = 0
-        pos_black = 0
-
-        for pos, piece in self.board.piece_map().items():
-            value = PIECE_WEIGHTS[piece.piece_type]
-
-            if piece.color == chess.WHITE:
-                material_white += value
-                pos_white += POSITION_SQUARES[pos]
-            else:
-                material_black += value
-                pos_black += POSITION_SQUARES[pos]
+        material = 0
 
-        # 3. Mobility
-        current_turn = board.turn
-        board.turn = chess.WHITE
+        for piece_type, weight in PIECE_WEIGHTS:
+            material += weight * (board.pieces_mask(piece_type, chess.WHITE).bit_count() -
+                                  board.pieces_mask(piece_type, chess.BLACK).bit_count())
 
-        mobility_white = len(list(board.legal_moves))
+        # 2. Mobility
+        mobility_score = mobility(board, chess.WHITE) - mobility(board, chess.BLACK)
 
-        board.turn = chess.BLACK
-        mobility_black = len(list(board.legal_moves))
+        # 3. We do not like trains
+        train = doubled_pawns(board.pawns & white) - doubled_pawns(board.pawns & black)
 
-        board.turn = current_turn
+        # 4. King safety
+        king_safety = (int(bool(board.kings & white & KING_SHELTER[chess.WHITE])) -
+                       int(bool(board.kings & black & KING_SHELTER[chess.BLACK])))
 
-        # 4. We do not like trains
-        train_white = 0
-        train_black = 0
+        # + for white
+        score = (
+            1.0 * material
+            + 0.5 * mobility_score
+            - 2.0 * train
+            + 0.25 * king_safety
+        )
 
-        for file in range(8):
-            white_pawns = 0
-            black_pawns = 0
-            for square in chess.SquareSet(chess.BB_FILES[file]):
-                if board.piece_at(square) == chess.Piece(chess.PAWN, chess.WHITE):
-                    white_pawns += 1
-                else:
-                    black_pawns += 1
+        return score if self.my_player == chess.WHITE else -score
 
-            train_white += white_pawns - 1
-            black_pawns += white_pawns - 1
+    def position_key(self) -> int:
+        """Transposition table key, kept by push and pop"""
+        return self.key
 
-        # 5. King safety
-        white_king_safety = 0
-        black_king_safety = 0
-        pos = board.king(chess.WHITE)
+    def push(self, move: chess.Move) -> None:
+        """Make the move on the board, updating the position key"""
+        self.keys.append(self.key)
+        self.key ^= move_key(self.board, move)
+        self.board.push(move)
+        self.key ^= castling_key(self.board) ^ ep_key(self.board)
 
-        file = chess.square_file(pos)
-        rank = chess.square_rank(pos)
+    def pop(self) -> None:
+        """Take back the last move"""
+        self.board.pop()
+        self.key = self.keys.pop()
 
-        if file == 0 or file == 7 or rank == 0:
-            white_king_safety += 1
+    def order_moves(self, moves, hash_move):
+        """Sort moves: hash move, captures of valuable pieces, the rest"""
+        board = self.board
 
-        pos = board.king(chess.BLACK)
+        def key(move):
+            if move == hash_move:
+                return 100
 
-        file = chess.square_file(pos)
-        rank = chess.square_rank(pos)
+            if board.is_capture(move):
+                victim = board.piece_type_at(move.to_square)
 
-        if file == 0 or file == 7 or rank == 7:
-            white_king_safety -= 1
+                # En passant leaves the target square empty
+                return 10 + CAPTURE_ORDER[victim or chess.PAWN]
 
-        # + for white
-        score = (
-            1.0 * (material_white - material_black)
-            + 0.5 * (mobility_white - mobility_black)
-            + 2.0 * (train_white - train_black)
-            + 0.25 * (white_king_safety - black_king_safety)
-        )
+            return 0
 
-        return score if self.my_player == chess.WHITE else -score
+        moves.sort(key=key, reverse=True)
 
     def minimax(
             self,
@@ -120,35 +283,68 @@ class ChessRandomAgent(AgentAdapter):
             alfa: float,
             beta: float,
     ) -> int:
-        """Decide which state is the best"""
+        """Decide which state is the best, with transposition table"""
+        self.nodes += 1
+
+        if not self.nodes & 255:
+            self.clock.check()
+
         outcome = self.board.outcome()
+        ply = len(self.board.move_stack) - self.root_ply
 
         if outcome is not None:
             if outcome.winner is None:
                 return 0
 
+            # Faster mates and slower losses first
             if outcome.winner == self.my_player:
-                return 10000 - depth
+                return MATE_SCORE - ply
             else:
-                return depth - 10000
+                return ply - MATE_SCORE
 
         if depth == 0:
             return self.evaluate()
 
+        key = self.position_key()
+        entry = self.tt.get(key)
+        hash_move = None
+
+        if entry is not None:
+            _, tt_depth, flag, tt_score, hash_move, _ = entry
+            tt_score = score_from_tt(tt_score, ply)
+
+            if tt_depth >= depth:
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER:
+                    alfa = max(alfa, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+
+                if beta <= alfa:
+                    return tt_score
+
         is_maximizing = self.board.turn == self.my_player
-        moves = self.board.legal_moves
+        moves = list(self.board.legal_moves)
+        self.order_moves(moves, hash_move)
+
+        alfa_orig, beta_orig = alfa, beta
+        best_move = None
 
         if is_maximizing:
             best_score = -float('inf')
 
             for move in moves:
-                self.board.push(move)
+                self.push(move)
 
                 score = self.minimax(depth - 1, alfa, beta)
 
-                self.board.pop()
+                self.pop()
+
+                if score > best_score:
+                    best_score = score
+                    best_move = move
 
-                best_score = max(score, best_score)
                 alfa = max(best_score, alfa)
 
                 if beta <= alfa:
@@ -157,26 +353,56 @@ class ChessRandomAgent(AgentAdapter):
             best_score = float('inf')
 
             for move in moves:
-                self.board.push(move)
+                self.push(move)
 
                 score = self.minimax(depth - 1, alfa, beta)
 
-                self.board.pop()
+                self.pop()
+
+                if score < best_score:
+                    best_score = score
+                    best_move = move
 
-                best_score = min(score, best_score)
                 beta = min(best_score, beta)
 
                 if beta <= alfa:
                     break
 
+        if best_score <= alfa_orig:
+            flag = UPPER
+        elif best_score >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+
+        self.tt.put(key, depth, flag, score_to_tt(best_score, ply), best_move)
+
         return best_score
 
-    def best_move(self, depth: int):
-        """Generate best move for current state"""
+    def search_root(self, moves, depth, scores):
+        """Search root moves to given depth, fill scores and return (best move, score)"""
         best_score = -float('inf')
         best_move = None
 
-        moves = self.board.legal_moves
+        for move in moves:
+            self.push(move)
+            # Moves that cannot beat best_score are cut early
+            score = self.minimax(depth - 1, best_score, float('inf'))
+            self.pop()
+
+            scores[move] = score
+
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+
+        self.tt.put(self.position_key(), depth, EXACT, best_score, best_move)
+
+        return best_move, best_score
+
+    def best_move(self, max_depth=None):
+        """Generate best move for current state using iterative deepening"""
+        moves = list(self.board.legal_moves)
         book_moves = list(self.book_reader.find_all(self.board))
 
         # Play book moves like a pro
@@ -185,34 +411,66 @@ class ChessRandomAgent(AgentAdapter):
             book_move = book_move_entry.move
             return book_move
 
-        for move in moves:
-            self.board.push(move)
+        max_depth = max_depth or self.max_depth
 
-            score = self.minimax(depth, -float('inf'), float('inf'))
+        self.tt.new_search()
+        self.clock.start(moves_left=MOVES_LEFT)
+        ply = len(self.board.move_stack)
+        self.root_ply = ply
 
-            self.board.pop()
+        # Best move of the previous search of this position goes first
+        entry = self.tt.get(self.position_key())
+        self.order_moves(moves, entry[4] if entry is not None else None)
 
-            if score > best_score:
-                best_score = score
-                best_move = move
+        best_move = moves[0]
+        depth = 1
+
+        try:
+            while depth <= max_depth:
+                scores = {}
+                best_move, best_score = self.search_root(moves, depth, scores)
+
+                # Mate found, deeper search changes nothing
+                if abs(best_score) >= MATE_BOUND:
+                    break
+
+                # Principal variation of this iteration goes first in the next,
+                # deeper in the tree it is found through hash moves
+                moves.sort(key=lambda m: scores[m], reverse=True)
+                depth += 1
+
+                # Next iteration would most likely not finish in time
+                if self.clock.elapsed() * 2 > self.clock.budget():
+                    break
+
+        except SearchTimeout:
+            while len(self.board.move_stack) > ply:
+                self.pop()
+
+        self.clock.stop()
 
         return best_move
 
     def play(self) -> bool:
         """Play random chess move"""
-        move = self.best_move(2)
-        self.board.push(move)
+        move = self.best_move()
+        self.push(move)
 
         return self.board.is_game_over()
 
     def register(self, uci: str) -> None:
         """Register user's move"""
         move = chess.Move.from_uci(uci)
-        self.board.push(move)
+        self.push(move)
 
     def reset(self, player: Player=Player.FIRST) -> None:
         """Reset the agent"""
         self.board = chess.Board()
+        self.key = polyglot.zobrist_hash(self.board)
+        self.keys = []
+        # Scores are stored from my_player's point of view
+        self.tt.clear()
+        self.clock.reset()
 
         if player == Player.FIRST:
             self.my_player = chess.WHITE
@@ -1,359 +1,381 @@
 # Piotr Stachowicz 337942
 import sys
 
+from backend.agents.jungle.jungle_board import (
+    ArrayLogic, PIECE_VALUES, DENS, DEN_TRAPS, EMPTY, to_coords, from_coords
+)
+from backend.agents.transposition import TranspositionTable, EXACT, LOWER, UPPER
+from backend.agents.time_control import TimeControl, SearchTimeout
 
-class Logic:
-    PIECE_VALUES = {
-        0: 4,
-        1: 1,
-        2: 2,
-        3: 3,
-        4: 5,
-        5: 7,
-        6: 8,
-        7: 10
-    }
-
-    MAXIMAL_PASSIVE = 30
-    DENS_DIST = 0.1
-    X = 7
-    Y = 9
-    traps = {(2, 0), (4, 0), (3, 1), (2, 8), (4, 8), (3, 7)}
-    ponds = {(x, y) for x in [1, 2, 4, 5] for y in [3, 4, 5]}
-    dens = [(3, 8), (3, 0)]
-    dirs = [(0, 1), (1, 0), (-1, 0), (0, -1)]
-
-    rat, cat, dog, wolf, jaguar, tiger, lion, elephant = range(8)
-
-    def __init__(self):
-        """Board constructor"""
-        self.board = self.init_board()
-        self.pieces = {0: {}, 1: {}}
-
-        for y in range(Logic.Y):
-            for x in range(Logic.X):
-                C: tuple = self.board[y][x]
-
-                if C:
-                    pl, pc = C
-                    self.pieces[pl][pc] = (x, y)
-
-        self.turn = 0
-        self.peace_counter = 0
-        self.winner = None
-
-    def quick_copy(self):
-        new_game = self.__class__.__new__(self.__class__)
-        new_game.board = [row[:] for row in self.board]
-
-        new_game.pieces = {
-            0: dict(self.pieces[0]),
-            1: dict(self.pieces[1])
-        }
-
-        new_game.turn = self.turn
-        new_game.peace_counter = self.peace_counter
-        new_game.winner = self.winner
-
-        return new_game
+# Own moves a game clock is expected to last for
+MOVES_LEFT = 40
 
-    @staticmethod
-    def init_board():
-        """Initiate board with defined state"""
-        pieces = """
-        L.....T
-        .D...C.
-        R.J.W.E
-        .......
-        .......
-        .......
-        e.w.j.r
-        .c...d.
-        t.....l
-        """
+# Move ordering: den entry wins at once, captures by MVV-LVA
+DEN_BONUS = 1 << 30
+HASH_MOVE_BONUS = 1 << 28
+CAPTURE_BONUS = 1 << 20
+TRAP_BONUS = 1 << 10
 
-        B = [x.strip() for x in pieces.split() if len(x) > 0]
-        T = dict(zip('rcdwjtle', range(8)))
+# Plies of captures and den threats searched after the horizon
+QUIESCENCE_DEPTH = 8
 
-        res = []
-        for y in range(9):
-            raw = 7 * [None]
+# Half width of the root window around the previous iteration's score
+ASPIRATION_WINDOW = 25
 
-            for x in range(7):
-                c = B[y][x]
+# Score of a won game, less one per ply from the root so faster wins
+# and slower losses come first
+WIN = 100000
 
-                if c != '.':
-                    if 'A' <= c <= 'Z':
-                        owner = 1
-                    else:
-                        owner = 0
+# Score of a repetition won by the peace rule, below real wins
+CYCLE_WIN = WIN // 2
 
-                    raw[x] = (owner, T[c.lower()])
+WIN_BOUND = WIN - 1000
 
-            res.append(raw)
+# Scores beyond this count plies, the table keeps them relative to the node
+DISTANCE_BOUND = CYCLE_WIN - 1000
 
-        return res
 
-    @staticmethod
-    def can_beat(p1, p2, pos1, pos2):
-        """Check whether p1 can beat p2"""
-        if pos1 in Logic.ponds and pos2 in Logic.ponds:
-            return True  # rat vs rat
+def score_to_tt(score, ply):
+    """Win distance counted from the root -> counted from the node"""
+    if score >= DISTANCE_BOUND:
+        return score + ply
+    if score <= -DISTANCE_BOUND:
+        return score - ply
 
-        if pos1 in Logic.ponds:
-            return False  # rat in pond cannot beat any piece on land
+    return score
 
-        if p1 == Logic.rat and p2 == Logic.elephant:
-            return True
 
-        if p1 == Logic.elephant and p2 == Logic.rat:
-            return False
+def score_from_tt(score, ply):
+    """Win distance counted from the node -> counted from the root"""
+    if score >= DISTANCE_BOUND:
+        return score - ply
+    if score <= -DISTANCE_BOUND:
+        return score + ply
 
-        if p1 >= p2:
-            return True
+    return score
 
-        if pos2 in Logic.traps:
-            return True
 
-        return False
+class JungleAlfaAgent(object):
+    def __init__(self, move_time=1.0, game_time=None, max_depth=32):
+        """Agent constructor"""
+        self.game: ArrayLogic = None
+        self.my_player = None
+        self.tt = TranspositionTable()
+        self.clock = TimeControl(move_time, game_time)
+        self.max_depth = max_depth
+        self.nodes = 0
+        # Length of the game history when the search started
+        self.root_ply = 0
+        # Repetition keys of the game since the last capture and the search path
+        self.path = set()
+        # Repetitions scored so far, scores resting on them depend on the path
+        self.repetitions = 0
+        self.reset()
 
-    def check_winner(self):
-        """Check who won"""
-        for i in range(7, -1, -1):
-            ps = []
+    def reset(self):
+        """Reset agent state"""
+        self.game = ArrayLogic()
+        self.my_player = 1
+        # Scores are stored relative to the side to move
+        self.tt.clear()
+        self.clock.reset()
+        self.publish('RDY')
 
-            for p in [0, 1]:
-                if i in self.pieces[p]:
-                    ps.append(p)
+    @staticmethod
+    def publish(what):
+        """Publish message to opponent"""
+        sys.stdout.write(what)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
 
-            if len(ps) == 1:
-                return ps[0]
+    @staticmethod
+    def sniff():
+        """Sniff message from opponent"""
+        line = sys.stdin.readline().split()
+        return line[0], line[1:]
 
-        return None
+    def evaluate(self, game: ArrayLogic):
+        """Heuristic evaluation function for Jungle game"""
+        if game.winner is not None:
+            score = WIN - (len(game.history) - self.root_ply)
 
-    def rat_is_blocking(self, pos, dx, dy):
-        """Check whether rat block that move"""
-        x, y = pos
-        nx = x + dx
+            return score if game.winner == self.my_player else -score
 
-        for player in [0, 1]:
-            if Logic.rat not in self.pieces[1 - player]:
-                continue
+        me = self.my_player
 
-            rx, ry = self.pieces[1 - player][Logic.rat]
+        # Material balance and own distance to enemy den, kept by do_move
+        return (game.material[me] - game.material[1 - me]) * 10 + game.position[me]
 
-            if (rx, ry) not in self.ponds:
-                continue
+    @staticmethod
+    def order_moves(game: ArrayLogic, moves, player, hash_move):
+        """Sort moves: den entry, hash move, captures (MVV-LVA), den traps"""
+        cells = game.cells
+        den = DENS[1 - player]
+        traps = DEN_TRAPS[1 - player]
 
-            if dy != 0:
-                if x == rx:
-                    return True
+        def key(move):
+            sq, sq2 = move
 
-            if dx != 0:
-                if y == ry and abs(x - rx) <= 2 and abs(nx - rx) <= 2:
-                    return True
+            if sq2 == den:
+                return DEN_BONUS
+            if move == hash_move:
+                return HASH_MOVE_BONUS
 
-        return False
+            victim = cells[sq2]
 
-    def moves(self, player):
-        """Return all possible moves"""
-        res = []
+            if victim != EMPTY:
+                return CAPTURE_BONUS + 16 * PIECE_VALUES[victim & 7] - PIECE_VALUES[cells[sq] & 7]
+            if sq2 in traps:
+                return TRAP_BONUS
 
-        for p, pos in self.pieces[player].items():
-            x, y = pos
+            return 0
 
-            for (dx, dy) in Logic.dirs:
-                pos2 = (nx, ny) = (x + dx, y + dy)
+        moves.sort(key=key, reverse=True)
 
-                if 0 <= nx < Logic.X and 0 <= ny < Logic.Y:
-                    if Logic.dens[player] == pos2:
-                        continue
+    def quiescence(self, game: ArrayLogic, alfa, beta, color, depth):
+        """
+        Resolve captures and den threats left at the horizon.
+        Scores are negamax scores, color is 1 when my_player is to move.
+        """
+        self.nodes += 1
 
-                    if pos2 in self.ponds:
-                        if p not in (Logic.rat, Logic.tiger, Logic.lion):
-                            continue
+        if not self.nodes & 255:
+            self.clock.check()
 
-                        if p == Logic.tiger or p == Logic.lion:
-                            if dx != 0:
-                                dx *= 3
-                            if dy != 0:
-                                dy *= 4
-                            if self.rat_is_blocking(pos, dx, dy):
-                                continue
+        if game.winner is not None:
+            return color * self.evaluate(game)
 
-                            pos2 = (nx, ny) = (x + dx, y + dy)
+        # Side to move may also decline all tactical moves
+        best_score = color * self.evaluate(game)
 
-                    if self.board[ny][nx] is not None:
-                        pl2, piece2 = self.board[ny][nx]
+        if depth == 0 or best_score >= beta:
+            return best_score
 
-                        if pl2 == player:
-                            continue
-                        if not self.can_beat(p, piece2, pos, pos2):
-                            continue
+        alfa = max(alfa, best_score)
+        player = self.my_player if color == 1 else 1 - self.my_player
 
-                    res.append((pos, pos2))
-        return res
+        moves = game.tactical_moves(player)
+        self.order_moves(game, moves, player, None)
 
-    def victory(self, player):
-        """Check if given player won"""
-        opponent = 1 - player
+        for move in moves:
+            game.do_move(move)
+            score = -self.quiescence(game, -beta, -alfa, -color, depth - 1)
+            game.undo_move()
 
-        if len(self.pieces[opponent]) == 0:
-            self.winner = player
-            return True
+            if score > best_score:
+                best_score = score
 
-        x, y = self.dens[opponent]
+                if score > alfa:
+                    alfa = score
 
-        if self.board[y][x]:
-            self.winner = player
-            return True
+                    if alfa >= beta:
+                        break
 
-        # Edge case for 'peace'
-        if self.peace_counter >= Logic.MAXIMAL_PASSIVE:
-            r = self.check_winner()
+        return best_score
 
-            if r is None:
-                self.winner = 1  # draw is second player's victory
-            else:
-                self.winner = r
-            return True
+    def negamax(self, game: ArrayLogic, depth, alfa, beta, color):
+        """
+        Principal variation search with transposition table. The first
+        move gets the full window, the rest a null window and are
+        searched again only when they turn out better.
+        """
+        if depth == 0:
+            return self.quiescence(game, alfa, beta, color, QUIESCENCE_DEPTH)
 
-        return False
+        self.nodes += 1
 
-    def do_move(self, move):
-        """Do the desired move"""
-        self.turn = 1 - self.turn
+        if not self.nodes & 255:
+            self.clock.check()
 
-        if move is None:
-            return
+        if game.winner is not None:
+            return color * self.evaluate(game)
 
-        pos1, pos2 = move
-        x, y = pos1
-        pl, pc = self.board[y][x]
+        player = self.my_player if color == 1 else 1 - self.my_player
 
-        x2, y2 = pos2
-        if self.board[y2][x2]:  # piece taken!
-            pl2, pc2 = self.board[y2][x2]
-            del self.pieces[pl2][pc2]
-            self.peace_counter = 0
-        else:
-            self.peace_counter += 1
+        # Cycles are scored at once instead of being searched to depth,
+        # repeating them forever ends the game by the peace rule
+        rep_key = game.repetition_key
 
-        self.pieces[pl][pc] = (x2, y2)
-        self.board[y2][x2] = (pl, pc)
-        self.board[y][x] = None
+        if rep_key in self.path:
+            self.repetitions += 1
+            score = CYCLE_WIN - (len(game.history) - self.root_ply)
 
+            return score if game.peace_winner() == player else -score
 
-class JungleAlfaAgent(object):
-    def __init__(self):
-        """Agent constructor"""
-        self.game: Logic = None
-        self.my_player = None
-        self.reset()
+        key = game.search_key(depth + QUIESCENCE_DEPTH)
+        entry = self.tt.get(key)
+        hash_move = None
+        ply = len(game.history) - self.root_ply
 
-    def reset(self):
-        """Reset agent state"""
-        self.game = Logic()
-        self.my_player = 1
-        self.publish('RDY')
+        if entry is not None:
+            _, tt_depth, flag, tt_score, hash_move, _ = entry
+            tt_score = score_from_tt(tt_score, ply)
 
-    @staticmethod
-    def publish(what):
-        """Publish message to opponent"""
-        sys.stdout.write(what)
-        sys.stdout.write('\n')
-        sys.stdout.flush()
+            if tt_depth >= depth:
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER:
+                    alfa = max(alfa, tt_score)
+                else:
+                    beta = min(beta, tt_score)
 
-    @staticmethod
-    def sniff():
-        """Sniff message from opponent"""
-        line = sys.stdin.readline().split()
-        return line[0], line[1:]
+                if beta <= alfa:
+                    return tt_score
 
-    @staticmethod
-    def copy_game(game) -> Logic:
-        return game.quick_copy()
+        moves = game.moves(player)
+        self.order_moves(game, moves, player, hash_move)
 
-    def evaluate(self, game: Logic):
-        """Heuristic evaluation function for Jungle game"""
-        if game.winner == self.my_player:
-            return float('inf')
-        elif game.winner == 1 - self.my_player:
-            return -float('inf')
+        alfa_orig = alfa
+        best_score = -float('inf')
+        best_move = None
+        repetitions = self.repetitions
+        self.path.add(rep_key)
 
-        score = 0
-        opponent = 1 - self.my_player
+        for i, move in enumerate(moves):
+            game.do_move(move)
 
-        opp_den = Logic.dens[opponent]
+            if i == 0:
+                score = -self.negamax(game, depth - 1, -beta, -alfa, -color)
+            else:
+                score = -self.negamax(game, depth - 1, -alfa - 1, -alfa, -color)
 
-        # Material balance
-        material = sum(Logic.PIECE_VALUES[pc] for pc in game.pieces[self.my_player])
-        material -= sum(Logic.PIECE_VALUES[pc] for pc in game.pieces[opponent])
-        score += material * 10
+                if alfa < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alfa, -color)
 
-        # Distance to enemy den
-        for _, (x, y) in game.pieces[self.my_player].items():
-            distance = abs(x - opp_den[0]) + abs(y - opp_den[1])
-            score += (14 - distance) * 3
+            game.undo_move()
 
-        return score
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
 
-    def minimax(self, game, depth, alfa, beta, is_maximizing):
-        if depth == 0:
-            return self.evaluate(game)
+                if score > alfa:
+                    alfa = score
 
-        if game.victory(self.my_player) or game.victory(1 - self.my_player):
-            return self.evaluate(game)
+                    if alfa >= beta:
+                        break
 
-        player = self.my_player if is_maximizing else 1 - self.my_player
+        self.path.discard(rep_key)
 
-        best_score = -float('inf') if is_maximizing else float('inf')
+        if best_score <= alfa_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
 
-        moves = game.moves(player)
+        # Scores resting on a repetition hold only for this path, keep just the move
+        if self.repetitions != repetitions:
+            depth = 0
 
-        if is_maximizing:
-            for move in moves:
-                game_copy = self.copy_game(game)
-                game_copy.do_move(move)
+        self.tt.put(key, depth, flag, score_to_tt(best_score, ply), best_move)
 
-                score = self.minimax(game_copy, depth - 1, alfa, beta, not is_maximizing)
+        return best_score
 
-                best_score = max(score, best_score)
-                alfa = max(alfa, best_score)
+    def root_key(self):
+        """Table key of the root, one horizon for every iteration so it can be probed"""
+        return self.game.search_key(self.max_depth + QUIESCENCE_DEPTH)
 
-                if beta <= alfa:
-                    break
-        else:
-            for move in moves:
-                game_copy = self.copy_game(game)
-                game_copy.do_move(move)
+    def search_root(self, moves, depth, alfa, beta, scores):
+        """
+        Search root moves to given depth within the window,
+        fill scores and return (best move, best score)
+        """
+        game = self.game
+        alfa_orig = alfa
+        best_score = -float('inf')
+        best_move = None
+        repetitions = self.repetitions
 
-                score = self.minimax(game_copy, depth - 1, alfa, beta, not is_maximizing)
+        for i, move in enumerate(moves):
+            game.do_move(move)
 
-                best_score = min(score, best_score)
-                alfa = min(alfa, best_score)
+            if i == 0:
+                score = -self.negamax(game, depth - 1, -beta, -alfa, -1)
+            else:
+                score = -self.negamax(game, depth - 1, -alfa - 1, -alfa, -1)
 
-                if beta <= alfa:
-                    break
+                if alfa < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alfa, -1)
 
-        return best_score
+            game.undo_move()
+
+            scores[move] = score
+
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+
+                if score > alfa:
+                    alfa = score
+
+                    if alfa >= beta:
+                        break
+
+        if alfa_orig < best_score < beta and self.repetitions == repetitions:
+            self.tt.put(self.root_key(), depth, EXACT, best_score, best_move)
+
+        return best_move, best_score
 
     def best_move(self):
-        """Simulate and evaluate game for each move"""
-        best_score = -float('inf')
-        best_move = None
+        """Pick the best possible move using iterative deepening"""
+        game = self.game
+        moves = game.moves(self.my_player)
+
+        if not moves:
+            return None
+
+        self.tt.new_search()
+        self.clock.start(moves_left=MOVES_LEFT)
+        ply = len(game.history)
+        self.root_ply = ply
+        self.path = set(game.repetition_keys())
+        self.path.add(game.repetition_key)
+
+        # Best move of the previous search of this position goes first
+        entry = self.tt.get(self.root_key())
+        self.order_moves(game, moves, self.my_player, entry[4] if entry is not None else None)
+
+        best_move = moves[0]
+        best_score = None
+        depth = 1
+
+        try:
+            while depth <= self.max_depth:
+                scores = {}
+
+                if best_score is None:
+                    alfa, beta = -float('inf'), float('inf')
+                else:
+                    alfa, beta = best_score - ASPIRATION_WINDOW, best_score + ASPIRATION_WINDOW
 
-        moves = self.game.moves(self.my_player)
+                move, score = self.search_root(moves, depth, alfa, beta, scores)
 
-        for move in moves:
-            game_copy = self.copy_game(self.game)
+                # Score fell outside the aspiration window, search it again
+                if score <= alfa or score >= beta:
+                    scores = {}
+                    move, score = self.search_root(moves, depth, -float('inf'), float('inf'), scores)
 
-            game_copy.do_move(move)
-            score = self.minimax(game_copy, 2, -float('inf'), float('inf'), False)
+                best_move, best_score = move, score
 
-            if score > best_score:
-                best_score = score
-                best_move = move
+                # Won by force, deeper search finds no faster win. A lost
+                # position is searched on for the slowest loss
+                if best_score >= WIN_BOUND:
+                    break
+
+                # Principal variation of this iteration goes first in the next,
+                # deeper in the tree it is found through hash moves
+                moves.sort(key=lambda m: scores[m], reverse=True)
+                depth += 1
+
+                # Next iteration would most likely not finish in time
+                if self.clock.elapsed() * 2 > self.clock.budget():
+                    break
+
+        except SearchTimeout:
+            while len(game.history) > ply:
+                game.undo_move()
+
+        self.clock.stop()
 
         return best_move
 
@@ -368,7 +390,7 @@ class JungleAlfaAgent(object):
                     move = None
                 else:
                     xs, ys, xd, yd = move
-                    move = ((xs, ys), (xd, yd))
+                    move = from_coords(((xs, ys), (xd, yd)))
 
                 self.game.do_move(move)
 
@@ -387,7 +409,8 @@ class JungleAlfaAgent(object):
 
             if move:
                 self.game.do_move(move)
-                move = (move[0][0], move[0][1], move[1][0], move[1][1])
+                (xs, ys), (xd, yd) = to_coords(move)
+                move = (xs, ys, xd, yd)
             else:
                 self.game.do_move(None)
                 move = (-1, -1, -1, -1)
@@ -0,0 +1,453 @@
+""" jungle_board.py
+
+Array based jungle engine. The board is a flat list of 63 cells,
+square (x, y) maps to index y * 7 + x, and every cell holds a piece
+code player * 8 + piece or EMPTY. Moves are (from square, to square)
+pairs and are made and unmade in place, so a search can work on one
+mutable state. ArrayLogic replaces the dict based Logic.
+Destinations of every piece from every square, including river jumps,
+are precomputed at import.
+"""
+from backend.agents.transposition import zobrist_keys
+
+X = 7
+Y = 9
+SIZE = X * Y
+
+EMPTY = -1
+
+PIECE_VALUES = [4, 1, 2, 3, 5, 7, 8, 10]
+
+MAXIMAL_PASSIVE = 30
+
+RAT, CAT, DOG, WOLF, JAGUAR, TIGER, LION, ELEPHANT = range(8)
+
+SQUARES = [(sq % X, sq // X) for sq in range(SIZE)]
+
+TRAPS = {y * X + x for x, y in [(2, 0), (4, 0), (3, 1), (2, 8), (4, 8), (3, 7)]}
+PONDS = {y * X + x for x in [1, 2, 4, 5] for y in [3, 4, 5]}
+# Den of player 0 and player 1
+DENS = [8 * X + 3, 0 * X + 3]
+DIRS = [(0, 1), (1, 0), (-1, 0), (0, -1)]
+# Traps guarding the den of player 0 and player 1
+DEN_TRAPS = [{sq for sq in TRAPS if abs(sq // X - DENS[p] // X) <= 1} for p in (0, 1)]
+# Empty squares a player threatens the enemy den from, or enters it
+DEN_THREATS = [DEN_TRAPS[1 - p] | {DENS[1 - p]} for p in (0, 1)]
+
+START = """
+L.....T
+.D...C.
+R.J.W.E
+.......
+.......
+.......
+e.w.j.r
+.c...d.
+t.....l
+"""
+
+
+def init_move_tables():
+    """
+    Precompute [player][piece][square] -> [(destination, water squares)].
+    Water squares are the pond squares a tiger or lion jumps over,
+    empty for ordinary steps. Board edges, ponds for pieces that cannot
+    swim and the own den are already excluded.
+    """
+    tables = []
+
+    for player in (0, 1):
+        per_piece = []
+
+        for pc in range(8):
+            per_square = []
+
+            for sq in range(SIZE):
+                x, y = SQUARES[sq]
+                dests = []
+
+                for dx, dy in DIRS:
+                    nx, ny = x + dx, y + dy
+
+                    if not (0 <= nx < X and 0 <= ny < Y):
+                        continue
+
+                    sq2 = ny * X + nx
+
+                    if sq2 == DENS[player]:
+                        continue
+
+                    water = ()
+
+                    if sq2 in PONDS:
+                        if pc not in (RAT, TIGER, LION):
+                            continue
+
+                        if pc != RAT:
+                            # Jump over the whole pond
+                            while sq2 in PONDS:
+                                water += (sq2,)
+                                nx, ny = nx + dx, ny + dy
+                                sq2 = ny * X + nx
+
+                    dests.append((sq2, water))
+
+                per_square.append(dests)
+
+            per_piece.append(per_square)
+
+        tables.append(per_piece)
+
+    return tables
+
+
+MOVE_TABLES = init_move_tables()
+
+
+def peace_buckets(step=4):
+    """
+    Peace counter -> bucket hashed into the position key. Counters are
+    grouped by 'step', searches which can reach the limit add the exact
+    counter to their keys (ArrayLogic.search_key).
+    """
+    return [c // step for c in range(MAXIMAL_PASSIVE + 1)]
+
+
+def init_position_tables():
+    """
+    Positional value of every piece code on every square, rewarding
+    pieces close to the enemy den (Manhattan distance).
+    """
+    tables = []
+
+    for code in range(16):
+        den_x, den_y = SQUARES[DENS[1 - (code >> 3)]]
+        tables.append([(14 - abs(x - den_x) - abs(y - den_y)) * 3 for x, y in SQUARES])
+
+    return tables
+
+
+POSITION_TABLES = init_position_tables()
+
+# Zobrist keys: piece code on square, side to move, peace bucket and exact peace counter
+_keys = zobrist_keys(16 * SIZE + 1 + 2 * (MAXIMAL_PASSIVE + 1), seed=337942)
+ZOBRIST = [_keys[code * SIZE:(code + 1) * SIZE] for code in range(16)]
+ZOBRIST_SIDE = _keys[16 * SIZE]
+ZOBRIST_PEACE = [_keys[16 * SIZE + 1 + b] for b in peace_buckets()]
+ZOBRIST_PEACE_EXACT = _keys[16 * SIZE + 1 + MAXIMAL_PASSIVE + 1:]
+
+
+def to_coords(move):
+    """(from square, to square) -> ((x, y), (x, y))"""
+    return SQUARES[move[0]], SQUARES[move[1]]
+
+
+def from_coords(move):
+    """((x, y), (x, y)) -> (from square, to square)"""
+    (x, y), (x2, y2) = move
+    return y * X + x, y2 * X + x2
+
+
+def can_beat(p1, p2, sq1, sq2):
+    """Check whether piece p1 on sq1 can beat piece p2 on sq2"""
+    if sq1 in PONDS and sq2 in PONDS:
+        return True  # rat vs rat
+
+    if sq1 in PONDS:
+        return False  # rat in pond cannot beat any piece on land
+
+    if p1 == RAT and p2 == ELEPHANT:
+        return True
+
+    if p1 == ELEPHANT and p2 == RAT:
+        return False
+
+    if p1 >= p2:
+        return True
+
+    if sq2 in TRAPS:
+        return True
+
+    return False
+
+
+class ArrayLogic:
+    PIECE_VALUES = PIECE_VALUES
+    MAXIMAL_PASSIVE = MAXIMAL_PASSIVE
+
+    def __init__(self):
+        """Board constructor"""
+        self.cells = self.init_cells()
+        # Square of every piece code, EMPTY once captured
+        self.pos = [EMPTY] * 16
+
+        for sq, code in enumerate(self.cells):
+            if code != EMPTY:
+                self.pos[code] = sq
+
+        self.turn = 0
+        self.peace_counter = 0
+        self.winner = None
+        # (from, to, captured code, peace counter, winner, hash) per move
+        self.history = []
+        self.hash = self.init_hash()
+        # Per player sums kept up to date by do_move / undo_move
+        self.material, self.position = self.init_accumulators()
+
+    @staticmethod
+    def init_cells():
+        """Initiate cells with defined state"""
+        rows = START.split()
+        kinds = dict(zip('rcdwjtle', range(8)))
+        cells = [EMPTY] * SIZE
+
+        for y in range(Y):
+            for x in range(X):
+                c = rows[y][x]
+
+                if c != '.':
+                    owner = 1 if 'A' <= c <= 'Z' else 0
+                    cells[y * X + x] = owner * 8 + kinds[c.lower()]
+
+        return cells
+
+    def init_hash(self):
+        """Compute Zobrist key of the position from scratch"""
+        key = ZOBRIST_PEACE[min(self.peace_counter, MAXIMAL_PASSIVE)]
+
+        if self.turn:
+            key ^= ZOBRIST_SIDE
+
+        for sq, code in enumerate(self.cells):
+            if code != EMPTY:
+                key ^= ZOBRIST[code][sq]
+
+        return key
+
+    def init_accumulators(self):
+        """Compute material and positional sums of both players from scratch"""
+        material = [0, 0]
+        position = [0, 0]
+
+        for code, sq in enumerate(self.pos):
+            if sq != EMPTY:
+                material[code >> 3] += PIECE_VALUES[code & 7]
+                position[code >> 3] += POSITION_TABLES[code][sq]
+
+        return material, position
+
+    def quick_copy(self) -> "ArrayLogic":
+        new = self.__class__.__new__(self.__class__)
+        new.cells = list(self.cells)
+        new.pos = list(self.pos)
+        new.turn = self.turn
+        new.peace_counter = self.peace_counter
+        new.winner = self.winner
+        new.history = list(self.history)
+        new.hash = self.hash
+        new.material = list(self.material)
+        new.position = list(self.position)
+        return new
+
+    @property
+    def board(self):
+        """Row based view of the board (None / (player, piece))"""
+        return [[None if c == EMPTY else (c >> 3, c & 7) for c in self.cells[y * X:(y + 1) * X]]
+                for y in range(Y)]
+
+    @property
+    def pieces(self):
+        """Dict based view {player: {piece: (x, y)}}"""
+        return {
+            player: {pc: SQUARES[self.pos[player * 8 + pc]]
+                     for pc in range(8) if self.pos[player * 8 + pc] != EMPTY}
+            for player in (0, 1)
+        }
+
+    def check_winner(self):
+        """Check who won"""
+        pos = self.pos
+
+        for pc in range(7, -1, -1):
+            alive = [player for player in (0, 1) if pos[player * 8 + pc] != EMPTY]
+
+            if len(alive) == 1:
+                return alive[0]
+
+        return None
+
+    def peace_winner(self):
+        """Winner if the game ended by the peace rule now"""
+        r = self.check_winner()
+
+        return 1 if r is None else r  # draw is second player's victory
+
+    def moves(self, player):
+        """Return all possible moves"""
+        res = []
+        cells = self.cells
+        pos = self.pos
+        table = MOVE_TABLES[player]
+        # Only rats can stand in water and block a jump
+        rats = (pos[RAT], pos[8 + RAT])
+
+        for pc in range(8):
+            sq = pos[player * 8 + pc]
+
+            if sq == EMPTY:
+                continue
+
+            for sq2, water in table[pc][sq]:
+                if water and (rats[0] in water or rats[1] in water):
+                    continue
+
+                target = cells[sq2]
+
+                if target != EMPTY:
+                    if target >> 3 == player:
+                        continue
+                    if not can_beat(pc, target & 7, sq, sq2):
+                        continue
+
+                res.append((sq, sq2))
+
+        return res
+
+    def tactical_moves(self, player):
+        """Captures, den entries and moves onto traps guarding the enemy den"""
+        res = []
+        cells = self.cells
+        pos = self.pos
+        table = MOVE_TABLES[player]
+        threats = DEN_THREATS[player]
+        rats = (pos[RAT], pos[8 + RAT])
+
+        for pc in range(8):
+            sq = pos[player * 8 + pc]
+
+            if sq == EMPTY:
+                continue
+
+            for sq2, water in table[pc][sq]:
+                target = cells[sq2]
+
+                if target == EMPTY:
+                    if sq2 in threats:
+                        res.append((sq, sq2))
+                    continue
+
+                if target >> 3 == player or not can_beat(pc, target & 7, sq, sq2):
+                    continue
+                if water and (rats[0] in water or rats[1] in water):
+                    continue
+
+                res.append((sq, sq2))
+
+        return res
+
+    def victory(self, player):
+        """Check if given player won, the winner is found by do_move"""
+        return self.winner == player
+
+    def terminal(self):
+        """Check if the game is over"""
+        return self.winner is not None
+
+    def search_key(self, horizon):
+        """
+        Transposition key for a search at most 'horizon' plies deep.
+        The exact peace counter is added once the peace rule can end
+        the game within the horizon.
+        """
+        if self.peace_counter + horizon >= MAXIMAL_PASSIVE:
+            return self.hash ^ ZOBRIST_PEACE_EXACT[min(self.peace_counter, MAXIMAL_PASSIVE)]
+
+        return self.hash
+
+    @property
+    def repetition_key(self):
+        """Zobrist key of the position without the peace counter"""
+        return self.hash ^ ZOBRIST_PEACE[min(self.peace_counter, MAXIMAL_PASSIVE)]
+
+    def repetition_keys(self):
+        """Keys of earlier positions that can still repeat (since the last capture)"""
+        keys = []
+
+        # Passes do not count towards the peace counter, walk back to the capture
+        for _, _, captured, peace, _, key in reversed(self.history):
+            if captured != EMPTY:
+                break
+
+            keys.append(key ^ ZOBRIST_PEACE[min(peace, MAXIMAL_PASSIVE)])
+
+        return keys
+
+    def do_move(self, move):
+        """Do the desired move, None is a pass"""
+        self.turn = 1 - self.turn
+
+        if move is None:
+            self.history.append((EMPTY, EMPTY, EMPTY, self.peace_counter, self.winner, self.hash))
+            self.hash ^= ZOBRIST_SIDE
+            return
+
+        sq, sq2 = move
+        cells = self.cells
+        code = cells[sq]
+        captured = cells[sq2]
+        peace = self.peace_counter
+
+        self.history.append((sq, sq2, captured, peace, self.winner, self.hash))
+
+        key = self.hash ^ ZOBRIST_SIDE ^ ZOBRIST[code][sq] ^ ZOBRIST[code][sq2]
+
+        table = POSITION_TABLES[code]
+        self.position[code >> 3] += table[sq2] - table[sq]
+
+        if captured != EMPTY:  # piece taken!
+            self.pos[captured] = EMPTY
+            self.peace_counter = 0
+            key ^= ZOBRIST[captured][sq2]
+            self.material[captured >> 3] -= PIECE_VALUES[captured & 7]
+            self.position[captured >> 3] -= POSITION_TABLES[captured][sq2]
+        else:
+            self.peace_counter += 1
+
+        self.hash = (key ^ ZOBRIST_PEACE[min(peace, MAXIMAL_PASSIVE)]
+                     ^ ZOBRIST_PEACE[min(self.peace_counter, MAXIMAL_PASSIVE)])
+
+        self.pos[code] = sq2
+        cells[sq2] = code
+        cells[sq] = EMPTY
+
+        # Only the move just made can end the game
+        player = code >> 3
+
+        if sq2 == DENS[1 - player] or self.material[1 - player] == 0:
+            self.winner = player
+
+        elif self.peace_counter >= MAXIMAL_PASSIVE:
+            self.winner = self.peace_winner()
+
+    def undo_move(self):
+        """Undo the last move"""
+        sq, sq2, captured, self.peace_counter, self.winner, self.hash = self.history.pop()
+        self.turn = 1 - self.turn
+
+        if sq == EMPTY:
+            return
+
+        cells = self.cells
+        code = cells[sq2]
+
+        self.pos[code] = sq
+        cells[sq] = code
+        cells[sq2] = captured
+
+        table = POSITION_TABLES[code]
+        self.position[code >> 3] += table[sq] - table[sq2]
+
+        if captured != EMPTY:
+            self.pos[captured] = sq2
+            self.material[captured >> 3] += PIECE_VALUES[captured & 7]
+            self.position[captured >> 3] += POSITION_TABLES[captured][sq2]
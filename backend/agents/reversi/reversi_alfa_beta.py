@@ -1,165 +1,94 @@
 # Piotr Stachowicz 337942
 import sys
 
-class Logic:
-    def __init__(self):
-        """Board constructor"""
-        self.board = self.init_board()
-        self.free_fields = set()
-        self.move_list = []
-        self.history = []
-
-        for i in range(8):
-            for j in range(8):
-                if self.board[i][j] is None:
-                    self.free_fields.add((j, i))
+from backend.agents.reversi.reversi_bitboard import BitboardLogic, popcount, neighbours
+from backend.agents.reversi.reversi_endgame import EndgameSolver
+from backend.agents.reversi.reversi_patterns import PatternWeights, PatternLogic
+from backend.agents.transposition import TranspositionTable, EXACT, LOWER, UPPER
+from backend.agents.time_control import TimeControl, SearchTimeout
 
-    @staticmethod
-    def init_board():
-        """Initiate board with defined state"""
-        board = [[None] * 8 for _ in range(8)]
-
-        board[3][3] = 1
-        board[4][4] = 1
-        board[3][4] = 0
-        board[4][3] = 0
-
-        return board
-
-    def moves(self, turn):
-        """Return all possible fields that can move"""
-        directions = [
-            (0, 1),
-            (1, 0),
-            (-1, 0),
-            (0, -1),
-            (1, 1),
-            (-1, -1),
-            (1, -1),
-            (-1, 1)
-        ]
-
-        res = []
-
-        for (x, y) in self.free_fields:
-            for direction in directions:
-                if self.can_beat(x, y, direction, turn):
-                    res.append((x, y))
-                    break
-
-        return res
-
-    def can_beat(self, x, y, d, turn):
-        """Return true if this move overthrows enemy's fields"""
-        dx, dy = d
-
-        x += dx
-        y += dy
-
-        cnt = 0
-
-        while self.get(x, y) == 1 - turn:
-            x += dx
-            y += dy
-            cnt += 1
-
-        return cnt > 0 and self.get(x, y) == turn
-
-    def get(self, x, y):
-        """Return value of (x, y) tile"""
-        if 0 <= x < 8 and 0 <= y < 8:
-            return self.board[y][x]
-
-        return None
-
-    def do_move(self, move, turn):
-        """Apply the move"""
-        directions = [
-            (0, 1),
-            (1, 0),
-            (-1, 0),
-            (0, -1),
-            (1, 1),
-            (-1, -1),
-            (1, -1),
-            (-1, 1)
-        ]
-
-        self.history.append([x[:] for x in self.board])
-        self.move_list.append(move)
-
-        if move is None:
-            return
-
-        x, y = move
-        x0, y0 = move
-
-        self.board[y][x] = turn
-        self.free_fields -= {move}
-
-        for dx, dy in directions:
-            x, y = x0, y0
-
-            to_beat = []
-
-            x += dx
-            y += dy
-
-            while self.get(x, y) == 1 - turn:
-                to_beat.append((x, y))
-                x += dx
-                y += dy
-
-            if self.get(x, y) == turn:
-                for (nx, ny) in to_beat:
-                    self.board[ny][nx] = turn
+# Static square weights used for move ordering
+SQUARE_WEIGHTS = [
+    100, -20, 10,  5,  5, 10, -20, 100,
+    -20, -50, -2, -2, -2, -2, -50, -20,
+     10,  -2,  1,  1,  1,  1,  -2,  10,
+      5,  -2,  1,  0,  0,  1,  -2,   5,
+      5,  -2,  1,  0,  0,  1,  -2,   5,
+     10,  -2,  1,  1,  1,  1,  -2,  10,
+    -20, -50, -2, -2, -2, -2, -50, -20,
+    100, -20, 10,  5,  5, 10, -20, 100
+]
 
-    def undo_move(self):
-        """Undo the move"""
-        prev_board = self.history.pop()
-        move = self.move_list.pop()
 
-        if move is not None:
-            self.free_fields.add(move)
+def square_mask(squares):
+    """Bitboard of (x, y) squares"""
+    mask = 0
 
-        self.board = prev_board
+    for x, y in squares:
+        mask |= 1 << (y * 8 + x)
 
-    def result(self):
-        """Check which site is winning"""
-        res = 0
+    return mask
 
-        for y in range(8):
-            for x in range(8):
-                b = self.board[y][x]
 
-                if b == 0:
-                    res -= 1
-                elif b == 1:
-                    res += 1
+# (corner, C squares, X squares) bitboards
+CORNER_C_X = [
+    (square_mask([(0, 0)]), square_mask([(1, 0), (0, 1)]), square_mask([(1, 1)])),
+    (square_mask([(7, 0)]), square_mask([(6, 0), (7, 1)]), square_mask([(6, 1)])),
+    (square_mask([(0, 7)]), square_mask([(0, 6), (1, 7)]), square_mask([(1, 6)])),
+    (square_mask([(7, 7)]), square_mask([(6, 7), (7, 6)]), square_mask([(6, 6)])),
+]
 
-        return res
+HASH_MOVE_BONUS = 1 << 30
+KILLER_BONUS = 1 << 24
 
-    def terminal(self):
-        if not self.free_fields:
-            return True
+# Part of the move budget the endgame solver may use before falling back
+ENDGAME_SHARE = 0.5
 
-        if len(self.move_list) < 2:
-            return False
-
-        return self.move_list[-1] is None and self.move_list[-2] is None
+# Worst measured exact solve time with ENDGAME_BASE_EMPTIES empty squares
+# and its growth with every further empty square
+ENDGAME_BASE_EMPTIES = 10
+ENDGAME_BASE_TIME = 0.1
+ENDGAME_GROWTH = 3.0
 
 
 class ReversiAlfaAgent(object):
-    def __init__(self):
+    def __init__(self, move_time=1.0, game_time=None, endgame_empties=None,
+                 patterns_path=None):
         """Reset agent"""
-        self.game: Logic = None
+        self.game: BitboardLogic = None
         self.my_player = None
+        # Pattern tables (train_patterns.py, usually PATTERNS_PATH) replace
+        # the mask evaluation only when given explicitly
+        self.patterns = None
+
+        if patterns_path is not None:
+            self.patterns = PatternWeights.load(patterns_path)
+
+        self.tt = TranspositionTable()
+        self.clock = TimeControl(move_time, game_time)
+        self.endgame = None
+        # None derives the solver threshold from the move budget
+        self.endgame_empties = endgame_empties
+        self.ordering = True
+        self.killers = None
+        self.history = None
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
         self.reset()
 
     def reset(self):
         """Reset agent"""
-        self.game = Logic()
+        # Pattern evaluation reads indices kept by the board
+        self.game = BitboardLogic() if self.patterns is None else PatternLogic()
         self.my_player = 1
+        # Scores are stored from my_player's point of view
+        self.tt.clear()
+        self.clock.reset()
+        self.endgame = EndgameSolver()
+        # Two killer moves per ply, history score per player and square
+        self.killers = [[None, None] for _ in range(130)]
+        self.history = [[0] * 64, [0] * 64]
         self.publish('RDY')
 
     @staticmethod
@@ -178,11 +107,9 @@ class ReversiAlfaAgent(object):
     def evaluate(self):
         """
         Improved heuristic evaluation of the board.
-        Combines positional weights, mobility, piece count, and corner strategy.
+        Combines corner strategy and frontier discs using precomputed masks.
         """
         player = self.my_player
-        opponent = 1 - player
-        board = self.game.board
 
         if self.game.terminal():
             game_res = self.game.result()
@@ -191,79 +118,76 @@ class ReversiAlfaAgent(object):
             else:
                 return -game_res * 10000
 
-        CORNER_C_X = {
-            (0, 0): {'C': [(0, 1), (1, 0)], 'X': [(1, 1)]},
-            (0, 7): {'C': [(0, 6), (1, 7)], 'X': [(1, 6)]},
-            (7, 0): {'C': [(6, 0), (7, 1)], 'X': [(6, 1)]},
-            (7, 7): {'C': [(6, 7), (7, 6)], 'X': [(6, 6)]},
-        }
+        if self.patterns is not None:
+            return self.patterns.evaluate_game(self.game, player)
 
-        my_vul = enemy_vul = 0
+        own = self.game.discs[player]
+        opp = self.game.discs[1 - player]
 
-        for r in range(8):
-            for c in range(8):
-                tile = board[r][c]
+        corner_related_score = 0
 
-                if tile is None:
-                    continue
+        for corner, c_squares, x_squares in CORNER_C_X:
+            if own & corner:
+                corner_related_score += 50
 
-                is_frontier = False
+            elif opp & corner:
+                corner_related_score -= 50
 
-                for dr in [-1, 0, 1]:
-                    for dc in [-1, 0, 1]:
-                        if dr == 0 and dc == 0:
-                            continue
+            else:
+                corner_related_score -= 35 * (popcount(own & c_squares) - popcount(opp & c_squares))
+                corner_related_score -= 45 * (popcount(own & x_squares) - popcount(opp & x_squares))
 
-                        nr, nc = r + dr, c + dc
+        # Discs next to an empty square are vulnerable
+        frontier = neighbours(self.game.empties)
+        frontier_score = -8 * (popcount(own & frontier) - popcount(opp & frontier))
 
-                        if 0 <= nr < 8 and 0 <= nc < 8 and board[nr][nc] is None:
-                            is_frontier = True
-                            break
+        final_score = (corner_related_score +
+                       frontier_score)
 
-                    if is_frontier:
-                        break
+        return final_score
 
-                if tile == player:
-                    if is_frontier:
-                        my_vul += 1
+    def order_moves(self, moves, player, hash_move):
+        """Sort moves: hash move, killer moves, history heuristic, square weights"""
+        killers = self.killers[len(self.game.move_list)]
+        history = self.history[player]
 
-                else:
-                    if is_frontier:
-                        enemy_vul += 1
+        def key(move):
+            if move == hash_move:
+                return HASH_MOVE_BONUS
 
-        corner_related_score = 0
+            x, y = move
+            score = history[y * 8 + x] + SQUARE_WEIGHTS[y * 8 + x]
 
-        for r_corn, c_corn in CORNER_C_X.keys():
-            corner_owner = board[r_corn][c_corn]
+            if move in killers:
+                score += KILLER_BONUS
 
-            if corner_owner == player:
-                corner_related_score += 50
+            return score
 
-            elif corner_owner == opponent:
-                corner_related_score -= 50
+        moves.sort(key=key, reverse=True)
 
-            else:
-                for c_sq_r, c_sq_c in CORNER_C_X[(r_corn, c_corn)]['C']:
-                    if board[c_sq_r][c_sq_c] == player:
-                        corner_related_score -= 35
-                    elif board[c_sq_r][c_sq_c] == opponent:
-                        corner_related_score += 35
+    def store_cutoff(self, move, player, depth, index):
+        """Remember move which caused beta cutoff"""
+        self.cutoffs += 1
 
-                for x_sq_r, x_sq_c in CORNER_C_X[(r_corn, c_corn)]['X']:
-                    if board[x_sq_r][x_sq_c] == player:
-                        corner_related_score -= 45
-                    elif board[x_sq_r][x_sq_c] == opponent:
-                        corner_related_score += 45
+        if index == 0:
+            self.first_cutoffs += 1
 
-        frontier_score = -8 * (my_vul - enemy_vul)
+        killers = self.killers[len(self.game.move_list)]
 
-        final_score = (corner_related_score +
-                       frontier_score)
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
 
-        return final_score
+        x, y = move
+        self.history[player][y * 8 + x] += depth * depth
 
     def minimax(self, depth, alfa, beta, is_maximizing):
-        """Alfa beta pruning algorithm"""
+        """Alfa beta pruning algorithm with transposition table"""
+        self.nodes += 1
+
+        if not self.nodes & 255:
+            self.clock.check()
+
         if depth == 0 or self.game.terminal():
             return self.evaluate()
 
@@ -282,58 +206,185 @@ class ReversiAlfaAgent(object):
 
             return score
 
+        key = self.game.hash
+        entry = self.tt.get(key)
+        hash_move = None
+
+        if entry is not None:
+            _, tt_depth, flag, tt_score, hash_move, _ = entry
+
+            if tt_depth >= depth:
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER:
+                    alfa = max(alfa, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+
+                if beta <= alfa:
+                    return tt_score
+
+        if self.ordering:
+            self.order_moves(moves, player, hash_move)
+        elif hash_move in moves:
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+        alfa_orig, beta_orig = alfa, beta
+        best_move = None
+
         if is_maximizing:
             best_score = -float('inf')
 
-            for move in moves:
+            for i, move in enumerate(moves):
                 self.game.do_move(move, player)
 
                 score = self.minimax(depth - 1, alfa, beta, not is_maximizing)
 
                 self.game.undo_move()
 
-                best_score = max(score, best_score)
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+
                 alfa = max(alfa, best_score)
 
                 if beta <= alfa:
+                    self.store_cutoff(move, player, depth, i)
                     break
 
-            return best_score
-
         else:
-            worst_score = float('inf')
+            best_score = float('inf')
 
-            for move in moves:
+            for i, move in enumerate(moves):
                 self.game.do_move(move, player)
 
                 score = self.minimax(depth - 1, alfa, beta, not is_maximizing)
 
                 self.game.undo_move()
 
-                worst_score = min(score, worst_score)
-                beta = min(beta, worst_score)
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+
+                beta = min(beta, best_score)
 
                 if beta <= alfa:
+                    self.store_cutoff(move, player, depth, i)
                     break
 
-            return worst_score
+        if best_score <= alfa_orig:
+            flag = UPPER
+        elif best_score >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
 
-    def best_move(self, moves):
-        """Pick the best possible move"""
+        self.tt.put(key, depth, flag, best_score, best_move)
+
+        return best_score
+
+    def search_root(self, moves, depth, scores):
+        """Search root moves to given depth, fill scores and return best move"""
         best_score = -float('inf')
         best_move = None
 
         for move in moves:
             self.game.do_move(move, self.my_player)
-            score = self.minimax(2, -float('inf'), float('inf'), False)
+            # Moves that cannot beat best_score are cut early
+            score = self.minimax(depth - 1, best_score, float('inf'), False)
             self.game.undo_move()
 
+            scores[move] = score
+
             if score > best_score:
                 best_score = score
                 best_move = move
 
         return best_move
 
+    def endgame_limit(self):
+        """Most empty squares the solver is expected to finish within its budget"""
+        if self.endgame_empties is not None:
+            return self.endgame_empties
+
+        budget = self.clock.budget() * ENDGAME_SHARE
+        empties = ENDGAME_BASE_EMPTIES
+        cost = ENDGAME_BASE_TIME
+
+        while empties > 0 and cost > budget:
+            cost /= ENDGAME_GROWTH
+            empties -= 1
+
+        while empties < 64 and cost * ENDGAME_GROWTH <= budget:
+            cost *= ENDGAME_GROWTH
+            empties += 1
+
+        return empties
+
+    def solve_endgame(self, moves):
+        """Solve the position exactly, None if it did not finish in time"""
+        own = self.game.discs[self.my_player]
+        opp = self.game.discs[1 - self.my_player]
+        mask = square_mask(moves)
+        deadline = self.clock.started + self.clock.budget() * ENDGAME_SHARE
+
+        try:
+            move, _, _ = self.endgame.solve(own, opp, deadline, mask)
+        except SearchTimeout:
+            return None
+
+        return move
+
+    def best_move(self, moves):
+        """Pick the best possible move using iterative deepening"""
+        empties = popcount(self.game.empties)
+
+        self.tt.new_search()
+        self.clock.start(moves_left=(empties + 1) // 2)
+
+        if empties <= self.endgame_limit():
+            move = self.solve_endgame(moves)
+
+            if move is not None:
+                self.clock.stop()
+                return move
+
+        # Older history is less relevant
+        for table in self.history:
+            for sq in range(64):
+                table[sq] >>= 1
+
+        ply = len(self.game.move_list)
+        order = list(moves)
+
+        if self.ordering:
+            self.order_moves(order, self.my_player, None)
+
+        best_move = order[0]
+        depth = 1
+
+        try:
+            while depth <= empties:
+                scores = {}
+                best_move = self.search_root(order, depth, scores)
+
+                # Previous iteration orders the next one
+                order.sort(key=lambda m: scores[m], reverse=True)
+                depth += 1
+
+                # Next iteration would most likely not finish in time
+                if self.clock.elapsed() * 2 > self.clock.budget():
+                    break
+
+        except SearchTimeout:
+            while len(self.game.move_list) > ply:
+                self.game.undo_move()
+
+        self.clock.stop()
+
+        return best_move
+
     def loop(self):
         """Fight for life"""
         CORNERS = {(0, 0), (0, 7), (7, 0), (7, 7)}
@@ -0,0 +1,376 @@
+""" reversi_bitboard.py
+
+Bitboard reversi engine. The board is kept as two 64-bit integers,
+one per player, where square (x, y) maps to bit y * 8 + x.
+BitboardLogic is a drop-in replacement for the list based Logic.
+"""
+from backend.agents.transposition import zobrist_keys
+
+FULL = 0xFFFFFFFFFFFFFFFF
+NOT_FILE_A = 0xFEFEFEFEFEFEFEFE
+NOT_FILE_H = 0x7F7F7F7F7F7F7F7F
+INNER = 0x7E7E7E7E7E7E7E7E
+
+DIRECTIONS = [
+    (0, 1),
+    (1, 0),
+    (-1, 0),
+    (0, -1),
+    (1, 1),
+    (-1, -1),
+    (1, -1),
+    (-1, 1)
+]
+
+
+def init_rays():
+    """Precompute rays (lists of bits) leaving every square"""
+    rays = []
+
+    for sq in range(64):
+        x0, y0 = sq % 8, sq // 8
+        sq_rays = []
+
+        for dx, dy in DIRECTIONS:
+            ray = []
+            x, y = x0 + dx, y0 + dy
+
+            while 0 <= x < 8 and 0 <= y < 8:
+                ray.append(1 << (y * 8 + x))
+                x += dx
+                y += dy
+
+            # Flip needs at least one enemy disc and own disc behind it
+            if len(ray) >= 2:
+                sq_rays.append(ray)
+
+        rays.append(sq_rays)
+
+    return rays
+
+
+RAYS = init_rays()
+SQUARES = [(sq % 8, sq // 8) for sq in range(64)]
+
+# Zobrist keys: disc of player p on square sq, and side to move
+_keys = zobrist_keys(129, seed=337942)
+ZOBRIST = [_keys[0:64], _keys[64:128]]
+ZOBRIST_SIDE = _keys[128]
+ZOBRIST_FLIP = [ZOBRIST[0][sq] ^ ZOBRIST[1][sq] for sq in range(64)]
+
+
+def popcount(bb):
+    """Count set bits"""
+    return bb.bit_count()
+
+
+def generate_moves(own, opp):
+    """Return bitboard of legal moves for the owner of 'own'"""
+    empty = ~(own | opp) & FULL
+    inner = opp & INNER
+    moves = 0
+
+    # East / West
+    t = inner & (own << 1)
+    t |= inner & (t << 1)
+    t |= inner & (t << 1)
+    t |= inner & (t << 1)
+    t |= inner & (t << 1)
+    t |= inner & (t << 1)
+    moves |= t << 1
+
+    t = inner & (own >> 1)
+    t |= inner & (t >> 1)
+    t |= inner & (t >> 1)
+    t |= inner & (t >> 1)
+    t |= inner & (t >> 1)
+    t |= inner & (t >> 1)
+    moves |= t >> 1
+
+    # South / North
+    t = opp & (own << 8)
+    t |= opp & (t << 8)
+    t |= opp & (t << 8)
+    t |= opp & (t << 8)
+    t |= opp & (t << 8)
+    t |= opp & (t << 8)
+    moves |= t << 8
+
+    t = opp & (own >> 8)
+    t |= opp & (t >> 8)
+    t |= opp & (t >> 8)
+    t |= opp & (t >> 8)
+    t |= opp & (t >> 8)
+    t |= opp & (t >> 8)
+    moves |= t >> 8
+
+    # Diagonals
+    t = inner & (own << 9)
+    t |= inner & (t << 9)
+    t |= inner & (t << 9)
+    t |= inner & (t << 9)
+    t |= inner & (t << 9)
+    t |= inner & (t << 9)
+    moves |= t << 9
+
+    t = inner & (own >> 9)
+    t |= inner & (t >> 9)
+    t |= inner & (t >> 9)
+    t |= inner & (t >> 9)
+    t |= inner & (t >> 9)
+    t |= inner & (t >> 9)
+    moves |= t >> 9
+
+    t = inner & (own << 7)
+    t |= inner & (t << 7)
+    t |= inner & (t << 7)
+    t |= inner & (t << 7)
+    t |= inner & (t << 7)
+    t |= inner & (t << 7)
+    moves |= t << 7
+
+    t = inner & (own >> 7)
+    t |= inner & (t >> 7)
+    t |= inner & (t >> 7)
+    t |= inner & (t >> 7)
+    t |= inner & (t >> 7)
+    t |= inner & (t >> 7)
+    moves |= t >> 7
+
+    return moves & empty
+
+
+def neighbours(bb):
+    """Return bitboard of squares adjacent to any square of bb"""
+    west = (bb >> 1) & NOT_FILE_H
+    east = (bb << 1) & NOT_FILE_A
+    row = bb | west | east
+
+    return (row | (row << 8) | (row >> 8)) & ~bb & FULL
+
+
+def compute_flips(own, opp, sq):
+    """Return bitboard of discs flipped by playing on square sq"""
+    flipped = 0
+
+    for ray in RAYS[sq]:
+        f = 0
+
+        for bit in ray:
+            if opp & bit:
+                f |= bit
+            elif own & bit:
+                flipped |= f
+                break
+            else:
+                break
+
+    return flipped
+
+
+def bits_to_squares(bb):
+    """Yield square indices of set bits"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class BitboardLogic:
+    def __init__(self):
+        """Board constructor"""
+        self.discs = self.init_discs()
+        self.move_list = []
+        self.history = []
+        self.hash = self.init_hash(self.discs)
+
+    @staticmethod
+    def init_discs():
+        """Initiate bitboards with defined state"""
+        return [
+            (1 << 28) | (1 << 35),
+            (1 << 27) | (1 << 36)
+        ]
+
+    @staticmethod
+    def init_hash(discs):
+        """Compute Zobrist key of the position from scratch"""
+        key = 0
+
+        for player in (0, 1):
+            for sq in bits_to_squares(discs[player]):
+                key ^= ZOBRIST[player][sq]
+
+        return key
+
+    def quick_copy(self) -> "BitboardLogic":
+        new = self.__class__.__new__(self.__class__)
+        new.discs = list(self.discs)
+        new.hash = self.hash
+        new.move_list = list(self.move_list)
+        new.history = list(self.history)
+        return new
+
+    @property
+    def empties(self):
+        """Bitboard of empty squares"""
+        return ~(self.discs[0] | self.discs[1]) & FULL
+
+    @property
+    def free_fields(self):
+        """Set of empty (x, y) squares"""
+        return {SQUARES[sq] for sq in bits_to_squares(self.empties)}
+
+    @property
+    def board(self):
+        """List based view of the board (None / 0 / 1)"""
+        board = [[None] * 8 for _ in range(8)]
+
+        for player in (0, 1):
+            for sq in bits_to_squares(self.discs[player]):
+                board[sq >> 3][sq & 7] = player
+
+        return board
+
+    def get(self, x, y):
+        """Return value of (x, y) tile"""
+        if 0 <= x < 8 and 0 <= y < 8:
+            bit = 1 << (y * 8 + x)
+
+            if self.discs[0] & bit:
+                return 0
+            if self.discs[1] & bit:
+                return 1
+
+        return None
+
+    def moves_mask(self, turn):
+        """Return bitboard of legal moves"""
+        return generate_moves(self.discs[turn], self.discs[1 - turn])
+
+    def moves(self, turn):
+        """Return all possible fields that can move"""
+        return [SQUARES[sq] for sq in bits_to_squares(self.moves_mask(turn))]
+
+    def do_move(self, move, turn):
+        """Apply the move"""
+        self.move_list.append(move)
+
+        if move is None:
+            self.history.append((turn, 0, 0, self.hash))
+            self.hash ^= ZOBRIST_SIDE
+            return
+
+        x, y = move
+        sq = y * 8 + x
+        placed = 1 << sq
+        own = self.discs[turn]
+        opp = self.discs[1 - turn]
+
+        flipped = compute_flips(own, opp, sq)
+
+        self.discs[turn] = own | flipped | placed
+        self.discs[1 - turn] = opp ^ flipped
+
+        # Only the delta is recorded, undo is two xors
+        self.history.append((turn, placed, flipped, self.hash))
+
+        key = self.hash ^ ZOBRIST_SIDE ^ ZOBRIST[turn][sq]
+
+        for f in bits_to_squares(flipped):
+            key ^= ZOBRIST_FLIP[f]
+
+        self.hash = key
+
+    def undo_move(self):
+        """Undo the move"""
+        turn, placed, flipped, self.hash = self.history.pop()
+        self.move_list.pop()
+
+        self.discs[turn] ^= flipped | placed
+        self.discs[1 - turn] ^= flipped
+
+    def result(self):
+        """Check which site is winning"""
+        return popcount(self.discs[1]) - popcount(self.discs[0])
+
+    @property
+    def passes(self):
+        """Number of passes in a row that ended the move list (up to 2)"""
+        passes = 0
+
+        for move in reversed(self.move_list[-2:]):
+            if move is not None:
+                break
+            passes += 1
+
+        return passes
+
+    def terminal(self):
+        """Check if state is terminal"""
+        if not self.empties:
+            return True
+
+        if len(self.move_list) < 2:
+            return False
+
+        return self.move_list[-1] is None and self.move_list[-2] is None
+
+
+class RolloutState:
+    """
+    Board and pass counter only, for states that are never undone
+    (MCTS descents and rollouts). Copying costs the same at any game length.
+    """
+    __slots__ = ('discs', 'passes')
+
+    def __init__(self, discs, passes=0):
+        """State constructor"""
+        self.discs = discs
+        self.passes = passes
+
+    @classmethod
+    def of(cls, state):
+        """Lightweight copy of BitboardLogic or RolloutState"""
+        return cls(list(state.discs), state.passes)
+
+    def quick_copy(self) -> "RolloutState":
+        return RolloutState(list(self.discs), self.passes)
+
+    @property
+    def empties(self):
+        """Bitboard of empty squares"""
+        return ~(self.discs[0] | self.discs[1]) & FULL
+
+    def moves_mask(self, turn):
+        """Return bitboard of legal moves"""
+        return generate_moves(self.discs[turn], self.discs[1 - turn])
+
+    def moves(self, turn):
+        """Return all possible fields that can move"""
+        return [SQUARES[sq] for sq in bits_to_squares(self.moves_mask(turn))]
+
+    def do_move(self, move, turn):
+        """Apply the move"""
+        if move is None:
+            self.passes += 1
+            return
+
+        x, y = move
+        sq = y * 8 + x
+        own = self.discs[turn]
+        opp = self.discs[1 - turn]
+
+        flipped = compute_flips(own, opp, sq)
+
+        self.discs[turn] = own | flipped | (1 << sq)
+        self.discs[1 - turn] = opp ^ flipped
+        self.passes = 0
+
+    def result(self):
+        """Check which site is winning"""
+        return popcount(self.discs[1]) - popcount(self.discs[0])
+
+    def terminal(self):
+        """Check if state is terminal"""
+        return self.passes >= 2 or not self.empties
@@ -0,0 +1,210 @@
+""" reversi_endgame.py
+
+Exact endgame solver for reversi working directly on bitboards.
+Uses negamax with alfa-beta, fastest-first ordering (fewest
+opponent replies first) and region parity (odd regions first).
+Final score is the disc difference as in Logic.result().
+"""
+import time
+
+from backend.agents.reversi.reversi_bitboard import (
+    generate_moves, compute_flips, bits_to_squares, popcount, SQUARES
+)
+from backend.agents.time_control import SearchTimeout
+
+# Empties above this use fastest-first, below only parity ordering
+FASTEST_FIRST_EMPTIES = 6
+
+# Bound table entries kept at most
+TABLE_SIZE = 1 << 18
+
+QUADRANTS = [
+    0x000000000F0F0F0F,
+    0x00000000F0F0F0F0,
+    0x0F0F0F0F00000000,
+    0xF0F0F0F000000000
+]
+
+
+def odd_regions(empties):
+    """Return mask of quadrants with odd number of empty squares"""
+    mask = 0
+
+    for quadrant in QUADRANTS:
+        if popcount(empties & quadrant) & 1:
+            mask |= quadrant
+
+    return mask
+
+
+class EndgameSolver:
+    def __init__(self):
+        """Solver constructor"""
+        self.nodes = 0
+        self.deadline = None
+        # (own, opp) -> (lower bound, upper bound)
+        self.table = {}
+
+    def check(self):
+        """Abort the search if the deadline has passed"""
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def ordered(self, own, opp, moves):
+        """Return [(flipped, sq)] sorted by parity and opponent mobility"""
+        empties = ~(own | opp) & 0xFFFFFFFFFFFFFFFF
+        odd = odd_regions(empties)
+        res = []
+
+        for sq in bits_to_squares(moves):
+            flipped = compute_flips(own, opp, sq)
+            placed = 1 << sq
+            mobility = popcount(generate_moves(opp ^ flipped, own | flipped | placed))
+            # Fewer replies first, odd region breaks ties
+            res.append((mobility * 2 + (0 if odd & placed else 1), flipped, sq))
+
+        res.sort()
+
+        return [(flipped, sq) for _, flipped, sq in res]
+
+    def last_move(self, own, opp, sq):
+        """Score position with one empty square"""
+        flipped = compute_flips(own, opp, sq)
+
+        if flipped:
+            return popcount(own) - popcount(opp) + 2 * popcount(flipped) + 1
+
+        flipped = compute_flips(opp, own, sq)
+
+        if flipped:
+            return popcount(own) - popcount(opp) - 2 * popcount(flipped) - 1
+
+        return popcount(own) - popcount(opp)
+
+    def negamax(self, own, opp, alfa, beta, passed):
+        """Exact disc difference for side owning 'own' bounded by window"""
+        self.nodes += 1
+
+        if not self.nodes & 1023:
+            self.check()
+
+        empties = ~(own | opp) & 0xFFFFFFFFFFFFFFFF
+
+        if empties & (empties - 1) == 0 and empties:
+            return self.last_move(own, opp, empties.bit_length() - 1)
+
+        moves = generate_moves(own, opp)
+
+        if not moves:
+            if passed:
+                return popcount(own) - popcount(opp)
+
+            return -self.negamax(opp, own, -beta, -alfa, True)
+
+        best = -64
+
+        if popcount(empties) > FASTEST_FIRST_EMPTIES:
+            key = (own, opp)
+            lower, upper = self.table.get(key, (-64, 64))
+
+            if lower >= beta:
+                return lower
+            if upper <= alfa:
+                return upper
+
+            alfa_orig = alfa = max(alfa, lower)
+            beta = min(beta, upper)
+
+            for flipped, sq in self.ordered(own, opp, moves):
+                score = -self.negamax(opp ^ flipped, own | flipped | (1 << sq),
+                                      -beta, -alfa, False)
+
+                if score > best:
+                    best = score
+
+                    if score > alfa:
+                        alfa = score
+
+                        if alfa >= beta:
+                            break
+
+            if len(self.table) >= TABLE_SIZE:
+                self.table.clear()
+
+            if best <= alfa_orig:
+                self.table[key] = (lower, best)
+            elif best >= beta:
+                self.table[key] = (best, upper)
+            else:
+                self.table[key] = (best, best)
+
+            return best
+
+        # Near the end parity ordering alone is cheaper
+        odd = odd_regions(empties)
+
+        for region_moves in (moves & odd, moves & ~odd):
+            for sq in bits_to_squares(region_moves):
+                flipped = compute_flips(own, opp, sq)
+                score = -self.negamax(opp ^ flipped, own | flipped | (1 << sq),
+                                      -beta, -alfa, False)
+
+                if score > best:
+                    best = score
+
+                    if score > alfa:
+                        alfa = score
+
+                        if alfa >= beta:
+                            return best
+
+        return best
+
+    def search_root(self, own, opp, moves, alfa, beta):
+        """Return (best square, score) within the given window"""
+        best_sq, best = None, -65
+
+        for flipped, sq in self.ordered(own, opp, moves):
+            score = -self.negamax(opp ^ flipped, own | flipped | (1 << sq),
+                                  -beta, -alfa, False)
+
+            if score > best:
+                best_sq, best = sq, score
+
+                if score > alfa:
+                    alfa = score
+
+                    if alfa >= beta:
+                        break
+
+        return best_sq, best
+
+    def solve(self, own, opp, deadline=None, moves=None):
+        """
+        Solve position for side owning 'own', which must have a legal move.
+        Win/loss/draw is proven first, exact disc difference after that.
+        Only squares from 'moves' bitboard are considered if given.
+        Returns ((x, y), score, exact) or raises SearchTimeout when
+        even the win/loss/draw search did not finish before the deadline.
+        Proven bounds are kept, so a timed out solve still helps the next one.
+        """
+        self.deadline = deadline
+        self.nodes = 0
+
+        if moves is None:
+            moves = generate_moves(own, opp)
+
+        sq, score = self.search_root(own, opp, moves, -1, 1)
+
+        try:
+            if score > 0:
+                sq, score = self.search_root(own, opp, moves, 0, 64)
+            elif score < 0:
+                sq, score = self.search_root(own, opp, moves, -64, 0)
+            else:
+                return SQUARES[sq], score, True
+
+        except SearchTimeout:
+            return SQUARES[sq], score, False
+
+        return SQUARES[sq], score, True
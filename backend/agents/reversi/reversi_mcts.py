@@ -1,280 +1,749 @@
 # Piotr Stachowicz 337942
+import os
 import sys
 import math
+import time
 import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend.agents.reversi.reversi_bitboard import BitboardLogic, RolloutState, bits_to_squares, SQUARES
+
+try:
+    import numpy as np
+    from backend.agents.reversi.reversi_rollouts import batch_simulate
+except ImportError:  # NumPy is not installed, rollouts stay serial
+    np = batch_simulate = None
+
+
+# Move code of a pass in the tree
+PASS = 64
+NO_CHILD = -1
+
+# Leaves simulated together by the vectorized rollout engine
+ROLLOUT_BATCH = 64
+
+# Rounds between budget checks of a serial search
+CHECK_ROUNDS = 32
+
+# Rounds and seconds a root parallel worker runs between budget checks
+ROOT_SLICE_ROUNDS = 4 * ROLLOUT_BATCH
+ROOT_SLICE_TIME = 0.1
+
+
+class Tree:
+    def __init__(self, capacity):
+        """Struct-of-arrays node storage preallocated for capacity nodes"""
+        self.capacity = capacity
+        self.size = 0
+        self.visits = array('i', bytes(4 * capacity))
+        # Wins of the player who made the move leading to the node
+        self.wins = array('i', bytes(4 * capacity))
+        # All-moves-as-first statistics, same point of view as wins
+        self.amaf_visits = array('i', bytes(4 * capacity))
+        self.amaf_wins = array('i', bytes(4 * capacity))
+        self.parent = array('i', bytes(4 * capacity))
+        # Children of a node are stored next to each other
+        self.first_child = array('i', [NO_CHILD]) * capacity
+        self.child_count = array('B', bytes(capacity))
+        self.move = array('B', bytes(capacity))
+
+    def clear(self):
+        """Drop all nodes and add an empty root"""
+        self.size = 0
+        self.add(NO_CHILD, PASS)
+
+    def add(self, parent, move):
+        """Append a node, return its index"""
+        node = self.size
+        self.size += 1
+
+        self.visits[node] = 0
+        self.wins[node] = 0
+        self.amaf_visits[node] = 0
+        self.amaf_wins[node] = 0
+        self.parent[node] = parent
+        self.first_child[node] = NO_CHILD
+        self.child_count[node] = 0
+        self.move[node] = move
+
+        return node
+
+    def expand(self, node, moves):
+        """Add children for move codes, False when there is no room"""
+        if self.size + len(moves) > self.capacity:
+            return False
 
-class Logic:
-    def __init__(self):
-        """Board constructor"""
-        self.board = self.init_board()
-        self.free_fields = set()
-        self.move_list = []
-        self.history = []
+        self.first_child[node] = self.size
+        self.child_count[node] = len(moves)
 
-        for i in range(8):
-            for j in range(8):
-                if self.board[i][j] is None:
-                    self.free_fields.add((j, i))
+        for move in moves:
+            self.add(node, move)
 
+        return True
 
-    def quick_copy(self) -> "Logic":
-        new = self.__class__.__new__(self.__class__)
-        new.board = [row.copy() for row in self.board]
-        new.free_fields = set(self.free_fields)
-        new.move_list = list(self.move_list)
-        new.history = list(self.history)
-        return new
+    def find_child(self, node, move):
+        """Return child reached by move code or NO_CHILD"""
+        first = self.first_child[node]
 
+        if first == NO_CHILD:
+            return NO_CHILD
 
-    @staticmethod
-    def init_board():
-        """Initiate board with defined state"""
-        board = [[None] * 8 for _ in range(8)]
-
-        board[3][3] = 1
-        board[4][4] = 1
-        board[3][4] = 0
-        board[4][3] = 0
-
-        return board
-
-    def moves(self, turn):
-        """Return all possible fields that can move"""
-        directions = [
-            (0, 1),
-            (1, 0),
-            (-1, 0),
-            (0, -1),
-            (1, 1),
-            (-1, -1),
-            (1, -1),
-            (-1, 1)
-        ]
+        for child in range(first, first + self.child_count[node]):
+            if self.move[child] == move:
+                return child
 
-        res = []
+        return NO_CHILD
 
-        for (x, y) in self.free_fields:
-            for direction in directions:
-                if self.can_beat(x, y, direction, turn):
-                    res.append((x, y))
-                    break
+    def reroot(self, root):
+        """Make root the new node 0 and compact its subtree in place"""
+        keep = []
+        stack = [root]
 
-        return res
+        while stack:
+            node = stack.pop()
+            keep.append(node)
+            first = self.first_child[node]
 
-    def can_beat(self, x, y, d, turn):
-        """Return true if this move overthrows enemy's fields"""
-        dx, dy = d
+            if first != NO_CHILD:
+                stack.extend(range(first, first + self.child_count[node]))
 
-        x += dx
-        y += dy
+        # Children are created after parents, sorting keeps blocks together
+        # and every node moves only towards lower indices
+        keep.sort()
+        index = {old: new for new, old in enumerate(keep)}
 
-        cnt = 0
+        for new, old in enumerate(keep):
+            first = self.first_child[old]
 
-        while self.get(x, y) == 1 - turn:
-            x += dx
-            y += dy
-            cnt += 1
+            self.visits[new] = self.visits[old]
+            self.wins[new] = self.wins[old]
+            self.amaf_visits[new] = self.amaf_visits[old]
+            self.amaf_wins[new] = self.amaf_wins[old]
+            self.parent[new] = index.get(self.parent[old], NO_CHILD)
+            self.first_child[new] = index[first] if first != NO_CHILD else NO_CHILD
+            self.child_count[new] = self.child_count[old]
+            self.move[new] = self.move[old]
 
-        return cnt > 0 and self.get(x, y) == turn
+        self.parent[0] = NO_CHILD
+        self.size = len(keep)
 
-    def get(self, x, y):
-        """Return value of (x, y) tile"""
-        if 0 <= x < 8 and 0 <= y < 8:
-            return self.board[y][x]
 
-        return None
+def simulate(state: RolloutState, player, played=None):
+    """
+    Play random moves until the end, return Logic.result().
+    Squares placed by each player are added to 'played' bitboards if given.
+    """
+    while not state.terminal():
+        moves = state.moves(player)
 
-    def do_move(self, move, turn):
-        """Apply the move"""
-        directions = [
-            (0, 1),
-            (1, 0),
-            (-1, 0),
-            (0, -1),
-            (1, 1),
-            (-1, -1),
-            (1, -1),
-            (-1, 1)
-        ]
+        if moves:
+            move = random.choice(moves)
+
+            if played is not None:
+                played[player] |= 1 << (move[1] * 8 + move[0])
+        else:
+            move = None
+
+        state.do_move(move, player)
+        player = 1 - player
+
+    return state.result()
+
+
+def to_code(move):
+    """(x, y) or None -> move code"""
+    return PASS if move is None else move[1] * 8 + move[0]
+
+
+def from_code(code):
+    """Move code -> (x, y) or None"""
+    return None if code == PASS else SQUARES[code]
+
+
+class MCTS:
+    def __init__(self, max_nodes=1000000, c=1.414, batch=1, rave=0):
+        """
+        Search tree kept between turns, at most max_nodes nodes.
+        With batch > 1 leaves are selected under virtual loss and
+        simulated together by the vectorized rollout engine.
+        With rave > 0 UCT blends in all-moves-as-first statistics,
+        rave is the number of visits at which both get equal weight.
+        """
+        self.tree = Tree(max_nodes)
+        self.c = c
+        self.rave = rave
+        self.batch = batch if batch_simulate is not None else 1
+        # Random generator of the vectorized rollouts
+        self.rng = np.random.default_rng() if np is not None else None
+        self.stopped = False
+        # Root position without history, descents copy it every round
+        self.root_state: RolloutState = None
+        self.root_player = None
+
+    def reset(self):
+        """Forget the kept tree"""
+        self.root_state = None
+        self.root_player = None
+
+    def set_root(self, state: BitboardLogic, player):
+        """Search from given state, the kept tree is reused if it matches"""
+        if (self.root_state is None or self.root_player != player
+                or self.root_state.discs != state.discs):
+            self.root_state = RolloutState.of(state)
+            self.root_player = player
+            self.tree.clear()
+
+    @property
+    def node_count(self):
+        """Number of nodes in the tree"""
+        return self.tree.size
+
+    def select_child(self, node):
+        """Pick child with the best UCT score"""
+        tree = self.tree
+        visits = tree.visits
+        wins = tree.wins
+        first = tree.first_child[node]
+
+        log_n = math.log(visits[node])
+        best, best_score = first, -1.0
+
+        for child in range(first, first + tree.child_count[node]):
+            v = visits[child]
+
+            if v == 0:
+                return child
+
+            score = wins[child] / v + self.c * math.sqrt(log_n / v)
+
+            if score > best_score:
+                best, best_score = child, score
+
+        return best
+
+    def select_child_rave(self, node):
+        """Pick child with the best UCT score over RAVE blended values"""
+        tree = self.tree
+        visits = tree.visits
+        wins = tree.wins
+        amaf_visits = tree.amaf_visits
+        amaf_wins = tree.amaf_wins
+        first = tree.first_child[node]
+        k = self.rave
+
+        log_n = math.log(visits[node])
+        best, best_score = first, -1.0
+
+        for child in range(first, first + tree.child_count[node]):
+            v = visits[child]
+            av = amaf_visits[child]
+
+            if av == 0:
+                if v == 0:
+                    return child
+
+                q = wins[child] / v
+            else:
+                # Weight of AMAF falls from 1 to 0 as real visits grow
+                beta = math.sqrt(k / (3 * v + k))
+                q = beta * amaf_wins[child] / av
+
+                if v:
+                    q += (1 - beta) * wins[child] / v
+
+            # Unvisited children are explored as if visited once
+            score = q + self.c * math.sqrt(log_n / (v or 1))
+
+            if score > best_score:
+                best, best_score = child, score
+
+        return best
+
+    def descend(self):
+        """Selection and expansion, returns (leaf, leaf state, player to move)"""
+        tree = self.tree
+        node = 0
+        player = self.root_player
+        # Positions are rebuilt by replaying moves from the root
+        state = self.root_state.quick_copy()
+
+        # Visits are counted on the way down, until backpropagation
+        # they act as a virtual loss for other pending descents
+        tree.visits[0] += 1
+        select = self.select_child_rave if self.rave else self.select_child
+
+        # Selection phase
+        while tree.first_child[node] != NO_CHILD:
+            node = select(node)
+            state.do_move(from_code(tree.move[node]), player)
+            player = 1 - player
+            tree.visits[node] += 1
+
+        # Expansion phase, stops growing at the memory cap
+        if not state.terminal():
+            moves = [sq for sq in bits_to_squares(state.moves_mask(player))] or [PASS]
+            random.shuffle(moves)
+
+            if tree.expand(node, moves):
+                node = tree.first_child[node]
+                state.do_move(from_code(tree.move[node]), player)
+                player = 1 - player
+                tree.visits[node] += 1
+
+        return node, state, player
 
-        self.history.append([x[:] for x in self.board])
-        self.move_list.append(move)
+    def backpropagate(self, node, player, res, played=None):
+        """
+        Add result of a rollout from node where player was to move.
+        'played' are bitboards of squares placed by each player during
+        the rollout, given only when RAVE statistics are kept.
+        """
+        tree = self.tree
+        winner = 1 if res > 0 else 0 if res < 0 else None
+        # Mover of the leaf is the player before it
+        mover = 1 - player
 
-        if move is None:
+        while node != NO_CHILD:
+            if mover == winner:
+                tree.wins[node] += 1
+
+            parent = tree.parent[node]
+
+            if played is not None and parent != NO_CHILD:
+                if tree.move[node] != PASS:
+                    played[mover] |= 1 << tree.move[node]
+
+                self.update_amaf(parent, played[mover], mover == winner)
+
+            node = parent
+            mover = 1 - mover
+
+    def update_amaf(self, node, played, won):
+        """Count the rollout for every child whose square was played later"""
+        tree = self.tree
+        first = tree.first_child[node]
+
+        for child in range(first, first + tree.child_count[node]):
+            move = tree.move[child]
+
+            if move != PASS and played >> move & 1:
+                tree.amaf_visits[child] += 1
+
+                if won:
+                    tree.amaf_wins[child] += 1
+
+    def iterate(self, rounds):
+        """Run MCTS rounds"""
+        if self.batch > 1:
+            self.iterate_batched(rounds)
             return
 
-        x, y = move
-        x0, y0 = move
+        for _ in range(rounds):
+            node, state, player = self.descend()
 
-        self.board[y][x] = turn
-        self.free_fields -= {move}
+            if self.rave:
+                played = [0, 0]
+                res = simulate(state, player, played)
+                self.backpropagate(node, player, res, played)
+            else:
+                self.backpropagate(node, player, simulate(state, player))
 
-        for dx, dy in directions:
-            x, y = x0, y0
+    def iterate_batched(self, rounds):
+        """Run MCTS rounds simulating batches of leaves at once"""
+        done = 0
 
-            to_beat = []
+        while done < rounds:
+            leaves = [self.descend() for _ in range(min(self.batch, rounds - done))]
+            jobs = [(state, player) for _, state, player in leaves]
 
-            x += dx
-            y += dy
+            if self.rave:
+                results, played = batch_simulate(jobs, self.rng, record=True)
 
-            while self.get(x, y) == 1 - turn:
-                to_beat.append((x, y))
-                x += dx
-                y += dy
+                for (node, _, player), res, (p0, p1) in zip(leaves, results, played):
+                    self.backpropagate(node, player, int(res), [int(p0), int(p1)])
+            else:
+                for (node, _, player), res in zip(leaves, batch_simulate(jobs, self.rng)):
+                    self.backpropagate(node, player, int(res))
 
-            if self.get(x, y) == turn:
-                for (nx, ny) in to_beat:
-                    self.board[ny][nx] = turn
+            done += len(leaves)
 
-    def undo_move(self):
-        """Undo the move"""
-        prev_board = self.history.pop()
-        move = self.move_list.pop()
+    def run(self, rounds=1000):
+        """Run MCTS rounds, return best move"""
+        self.iterate(rounds)
 
-        if move is not None:
-            self.free_fields.add(move)
+        return self.most_visited()
 
-        self.board = prev_board
+    def search(self, state: BitboardLogic, player, rounds=None, time_budget=None):
+        """
+        Search until 'rounds' are done or 'time_budget' seconds are spent,
+        whichever comes first. Stops early when the most visited move
+        can no longer be overtaken, or when stop() is called.
+        """
+        if rounds is None and time_budget is None:
+            rounds = 2000
 
-    def result(self):
-        """Check which site is winning"""
-        res = 0
+        self.set_root(state, player)
+        self.stopped = False
 
-        for y in range(8):
-            for x in range(8):
-                b = self.board[y][x]
+        step = max(self.batch, CHECK_ROUNDS)
+        start = time.perf_counter()
+        done = 0
 
-                if b == 0:
-                    res -= 1
-                elif b == 1:
-                    res += 1
+        while not self.stopped:
+            n = step if rounds is None else min(step, rounds - done)
 
-        return res
+            if n <= 0:
+                break
 
-    def terminal(self):
-        """Check if state is terminal"""
-        if not self.free_fields:
-            return True
+            self.iterate(n)
+            done += n
 
-        if len(self.move_list) < 2:
-            return False
+            remaining = float('inf') if rounds is None else rounds - done
+
+            if time_budget is not None:
+                elapsed = time.perf_counter() - start
+
+                if elapsed >= time_budget:
+                    break
+
+                # Rounds that still fit into the budget at the current rate
+                remaining = min(remaining, done / elapsed * (time_budget - elapsed))
+
+            if self.decided(remaining):
+                break
+
+        return self.most_visited()
 
-        return self.move_list[-1] is None and self.move_list[-2] is None
+    def decided(self, remaining):
+        """Check if the most visited root move cannot be overtaken"""
+        visits = sorted(self.root_visits().values(), reverse=True)
 
-class Node:
-    def __init__(self, state: Logic, player: int, parent=None):
-        """Node constructor"""
-        self.state = state
-        self.player = player
-        self.parent = parent
-        self.visits = 0
-        self.wins = 0
-        self.moves = self.init_moves()
-        self.children = {}
+        if len(visits) < 2:
+            return bool(visits)
 
-    def init_moves(self):
-        """Initiate untried states"""
-        return self.state.moves(self.player)
+        return visits[0] - visits[1] > remaining
 
-    def expand(self):
-        """Expand the node"""
-        not_touched = [move for move in self.moves if move not in self.children]
+    def stop(self):
+        """Ask a running search to return (e.g. from another thread)"""
+        self.stopped = True
 
-        if not not_touched:
+    def best_move_so_far(self):
+        """Current most visited move, None before the root is expanded"""
+        if not self.root_visits():
             return None
 
-        move: Logic = random.choice(not_touched)
+        return self.most_visited()
 
-        new_state = self.state.quick_copy()
-        new_state.do_move(move, self.player)
+    def root_visits(self):
+        """Return {move code: visits} of root children"""
+        tree = self.tree
+        first = tree.first_child[0]
 
-        child = Node(new_state, 1 - self.player, self)
+        if first == NO_CHILD:
+            return {}
 
-        self.children[move] = child
+        return {tree.move[c]: tree.visits[c] for c in range(first, first + tree.child_count[0])}
 
-        return child
+    def most_visited(self):
+        """Move of the most visited root child"""
+        visits = self.root_visits()
 
-    def is_expanded(self):
-        """Check if node is fully expanded"""
-        return len(self.children) == len(self.moves)
+        return from_code(max(visits, key=visits.get))
 
-    def uct_score(self, c=1.414):
-        """UCT SCORE"""
-        if self.visits == 0:
-            return float('inf')
+    def advance(self, move):
+        """Re-root the tree on the child reached by move"""
+        if self.root_state is None:
+            return
 
-        return self.wins / self.visits + c * math.sqrt(math.log(self.parent.visits) / self.visits)
+        child = self.tree.find_child(0, to_code(move))
 
+        self.root_state.do_move(move, self.root_player)
+        self.root_player = 1 - self.root_player
 
-    def best_child(self, c=1.414):
-        """Pick best child"""
-        _, best_node = max(self.children.items(), key=lambda item: item[1].uct_score(c))
-        return best_node
+        if child == NO_CHILD:
+            self.tree.clear()
+        else:
+            # Unreachable nodes are dropped by compaction
+            self.tree.reroot(child)
 
-class MCTS:
-    @staticmethod
-    def run(root: Node, rounds=1000):
-        """Run MCTS rounds"""
-        for _ in range(rounds):
-            node = root
+    def best_move(self, state: BitboardLogic, player):
+        """Pick best move for current state, reusing the kept tree"""
+        return self.search(state, player, rounds=2000)
 
-            # Selection phase
-            while node.is_expanded() and node.children:
-                node = node.best_child()
+    def close(self):
+        """Release resources, a serial search holds none"""
+        pass
 
-            # Expansion phase
-            if not node.state.terminal():
-                node = node.expand() or node
 
-            # Simulation phase
-            rollout_state: Logic = node.state.quick_copy()
-            player = node.player
+def rollout_batch(jobs, seed, record=False):
+    """
+    Worker: simulate every (state, player) job, return results,
+    or (result, played bitboards) pairs when record is set
+    """
+    random.seed(seed)
+    rng = np.random.default_rng(seed) if np is not None else None
 
-            while not rollout_state.terminal():
-                moves = rollout_state.moves(player)
+    if not record:
+        if batch_simulate is not None:
+            return [int(res) for res in batch_simulate(jobs, rng)]
 
-                if moves:
-                    move = random.choice(moves)
-                else:
-                    move = None
+        return [simulate(state, player) for state, player in jobs]
 
-                rollout_state.do_move(move, player)
-                player = 1 - player
+    if batch_simulate is not None:
+        results, played = batch_simulate(jobs, rng, record=True)
+
+        return [(int(res), [int(p0), int(p1)]) for res, (p0, p1) in zip(results, played)]
 
-            res = rollout_state.result()
+    res = []
 
-            is_win = (root.player == 1 and res > 0) or (root.player == 0 and res < 0)
+    for state, player in jobs:
+        played = [0, 0]
+        res.append((simulate(state, player, played), played))
 
-            # Backpropagation phase
-            while node:
-                node.visits += 1
+    return res
 
-                if is_win:
-                    node.wins += 1
 
-                node = node.parent
+# Search kept by a root parallel worker process between moves
+worker = {'mcts': None, 'root': None, 'played': 0, 'reported': {}}
+
+
+def root_search(state, player, root_id, played, rounds, time_budget, max_nodes, rave, seed):
+    """
+    Worker: grow the tree this process keeps for root 'root_id', advanced
+    by the 'played' moves. Return ({move code: visits} not returned before,
+    rounds run).
+    """
+    random.seed(seed)
+    mcts = worker['mcts']
+
+    if mcts is None or mcts.tree.capacity != max_nodes:
+        mcts = worker['mcts'] = MCTS(max_nodes, batch=ROLLOUT_BATCH)
+
+    mcts.rave = rave
+
+    if np is not None:
+        mcts.rng = np.random.default_rng(seed)
+
+    if worker['root'] != root_id or worker['played'] > len(played):
+        mcts.reset()
+    else:
+        for move in played[worker['played']:]:
+            mcts.advance(move)
+
+    if worker['root'] != root_id or worker['played'] != len(played):
+        worker['reported'] = {}
+
+    worker['root'] = root_id
+    worker['played'] = len(played)
+
+    root = mcts.root_state
+    before = sum(mcts.root_visits().values()) if root is not None else 0
+    mcts.search(state, player, rounds, time_budget)
+
+    # The kept tree did not match and was dropped
+    if mcts.root_state is not root:
+        worker['reported'] = {}
+        before = 0
+
+    visits = mcts.root_visits()
+    reported = worker['reported']
+    worker['reported'] = visits
+
+    return {code: n - reported.get(code, 0) for code, n in visits.items()}, sum(visits.values()) - before
+
+
+class ParallelMCTS(MCTS):
+    def __init__(self, workers=None, mode='root', batch=None, max_nodes=1000000, c=1.414, rave=0):
+        """
+        MCTS over a process pool.
+        mode 'root' - every worker grows and keeps its own tree, root visits
+                      are summed
+        mode 'leaf' - one tree, batches of leaves selected under virtual loss
+                      are simulated by the workers
+        """
+        # In root mode the trees live in the workers
+        super().__init__(max_nodes if mode == 'leaf' else 1, c, rave=rave)
+        self.max_nodes = max_nodes
+        self.workers = workers or os.cpu_count()
+        self.mode = mode
+        self.batch = batch or ROLLOUT_BATCH * self.workers
+        self.pool = None
+        # Summed root visits of the last root parallel search
+        self.merged = {}
+        # Root the worker trees grow from and moves played since
+        self.root_id = None
+        self.played = []
+
+    def executor(self):
+        """Process pool, started on first use"""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+
+        return self.pool
+
+    def close(self):
+        """Stop worker processes"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def set_root(self, state: BitboardLogic, player):
+        """Search from given state, worker trees start over on a new root"""
+        root = self.root_state
+        super().set_root(state, player)
+
+        if self.root_state is not root:
+            self.root_id = random.getrandbits(64)
+            self.played = []
+
+    def advance(self, move):
+        """Re-root the tree, worker trees follow on their next search"""
+        super().advance(move)
+        self.played.append(move)
+
+    def iterate(self, rounds):
+        """Run MCTS rounds in parallel"""
+        if self.mode == 'root':
+            self.run_root(rounds, None)
+        else:
+            self.run_leaf(rounds)
+
+    def search(self, state: BitboardLogic, player, rounds=None, time_budget=None):
+        """
+        Budgeted search. Root mode runs the workers in short slices and
+        sums their visits after each, so like the serial search it can
+        be stopped and polled for the best move so far.
+        """
+        if self.mode != 'root':
+            return super().search(state, player, rounds, time_budget)
+
+        if rounds is None and time_budget is None:
+            rounds = 2000
+
+        self.set_root(state, player)
+        self.merged = {}
+        self.stopped = False
+
+        step = ROOT_SLICE_ROUNDS * self.workers
+        start = time.perf_counter()
+        done = 0
+
+        while not self.stopped:
+            n = step if rounds is None else min(step, rounds - done)
+
+            if n <= 0:
+                break
 
-        best_move, _ = max(root.children.items(), key=lambda item: item[1].visits)
-        return best_move
+            budget = ROOT_SLICE_TIME
 
-    @staticmethod
-    def best_move(state: Logic, player):
-        """Pick best move for current state"""
-        root = Node(state, player)
+            if time_budget is not None:
+                budget = min(budget, time_budget - (time.perf_counter() - start))
+
+            ran = self.run_root(n, budget)
+            done += ran
+
+            remaining = float('inf') if rounds is None else rounds - done
+
+            if time_budget is not None:
+                elapsed = time.perf_counter() - start
+
+                if elapsed >= time_budget:
+                    break
+
+                remaining = min(remaining, done / elapsed * (time_budget - elapsed))
+
+            # Workers found nothing to search
+            if not ran or self.decided(remaining):
+                break
+
+        return self.most_visited()
+
+    def root_visits(self):
+        """Summed visits in root mode, own tree otherwise"""
+        if self.mode == 'root':
+            return self.merged
+
+        return super().root_visits()
+
+    def run_root(self, rounds, time_budget):
+        """
+        Root parallelization, workers share rounds and use the same time.
+        Visits are summed as workers finish, return the rounds run.
+        """
+        pool = self.executor()
+        share = -(-rounds // self.workers)
+
+        futures = [
+            pool.submit(root_search, self.root_state, self.root_player, self.root_id, self.played,
+                        share, time_budget, self.max_nodes, self.rave, random.getrandbits(32))
+            for _ in range(self.workers)
+        ]
+
+        done = 0
+
+        for future in as_completed(futures):
+            visits, ran = future.result()
+            merged = dict(self.merged)
+
+            for code, n in visits.items():
+                merged[code] = merged.get(code, 0) + n
+
+            # A finished dict is published, readers on other threads never see one being filled
+            self.merged = merged
+            done += ran
+
+        return done
+
+    def run_leaf(self, rounds):
+        """Leaf parallelization with virtual loss"""
+        pool = self.executor()
+        done = 0
+
+        while done < rounds:
+            leaves = [self.descend() for _ in range(min(self.batch, rounds - done))]
+            parts = [leaves[i::self.workers] for i in range(self.workers)]
+
+            futures = [
+                pool.submit(rollout_batch, [(state, player) for _, state, player in part],
+                            random.getrandbits(32), bool(self.rave))
+                for part in parts if part
+            ]
+
+            for part, future in zip(parts, futures):
+                for (node, _, player), res in zip(part, future.result()):
+                    if self.rave:
+                        self.backpropagate(node, player, res[0], res[1])
+                    else:
+                        self.backpropagate(node, player, res)
+
+            done += len(leaves)
 
-        return MCTS.run(root, 2000)
 
 class ReversiMCTSAgent(object):
-    def __init__(self):
-        """Reset agent"""
-        self.game: Logic = None
+    def __init__(self, workers=1, mode='root', rounds=2000, move_time=None, rave=0):
+        """
+        Reset agent, more workers than one enable parallel MCTS.
+        Every move is searched for at most 'rounds' rounds and
+        'move_time' seconds (None for no limit), rave > 0 enables RAVE.
+        """
+        self.game: BitboardLogic = None
         self.my_player = None
+        self.rounds = rounds
+        self.move_time = move_time
+
+        if workers > 1:
+            self.mcts: MCTS = ParallelMCTS(workers, mode, rave=rave)
+        else:
+            self.mcts: MCTS = MCTS(batch=ROLLOUT_BATCH, rave=rave)
+
         self.reset()
 
     def reset(self):
         """Reset agent"""
-        self.game = Logic()
+        self.game = BitboardLogic()
         self.my_player = 1
+        self.mcts.reset()
         self.publish('RDY')
 
     @staticmethod
@@ -292,7 +761,12 @@ class ReversiMCTSAgent(object):
 
     def best_move(self):
         """Pick the best possible move"""
-        return MCTS.best_move(self.game.quick_copy(), self.my_player)
+        return self.mcts.search(self.game, self.my_player, self.rounds, self.move_time)
+
+    def do_move(self, move, player):
+        """Apply the move to the game and to the kept search tree"""
+        self.game.do_move(move, player)
+        self.mcts.advance(move)
 
     def loop(self):
         """Fight for life"""
@@ -304,13 +778,14 @@ class ReversiMCTSAgent(object):
                 if move == (-1, -1):
                     move = None
 
-                self.game.do_move(move, 1 - self.my_player)
+                self.do_move(move, 1 - self.my_player)
 
             elif cmd == 'ONEMORE':
                 self.reset()
                 continue
 
             elif cmd == 'BYE':
+                self.mcts.close()
                 break
 
             else:
@@ -322,10 +797,10 @@ class ReversiMCTSAgent(object):
 
             if moves:
                 move = self.best_move()
-                self.game.do_move(move, self.my_player)
+                self.do_move(move, self.my_player)
 
             else:
-                self.game.do_move(None, self.my_player)
+                self.do_move(None, self.my_player)
                 move = (-1, -1)
 
             self.publish('IDO %d %d' % move)
@@ -0,0 +1,336 @@
+""" reversi_patterns.py
+
+Pattern based evaluation for reversi. Every edge, diagonal and 2x5
+corner region of the board is read as a base-3 number (empty / own /
+opponent) which indexes a precomputed weight table. Symmetric regions
+share one table, they are read from flipped and transposed bitboards.
+
+Tables are built offline by train_patterns.py and stored as a small
+header followed by little-endian int16 weights, which are memory-mapped
+at startup.
+
+PatternLogic keeps the indices packed into one integer and updates them
+in do_move. Small diagonals share a field read from a joint table, so an
+evaluation takes 24 lookups and no pass over the board.
+"""
+import os
+import sys
+import mmap
+import struct
+from array import array
+from operator import getitem
+
+from backend.agents.reversi.reversi_bitboard import (
+    BitboardLogic, ZOBRIST, ZOBRIST_SIDE, ZOBRIST_FLIP, popcount, bits_to_squares, compute_flips
+)
+
+MAGIC = b'RVPT'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+
+# Weights are stored in hundredths of a disc
+SCALE = 100
+
+# Default table location, data/ at repository root
+PATTERNS_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'data', 'reversi_patterns.bin'
+))
+
+# (name, squares in pattern)
+PATTERNS = [
+    ('edge', 8),
+    ('corner', 10),
+    ('diag8', 8),
+    ('diag7', 7),
+    ('diag6', 6),
+    ('diag5', 5),
+    ('diag4', 4),
+]
+
+
+def init_offsets():
+    """Return start of every pattern table inside one phase and phase size"""
+    offsets = {}
+    size = 0
+
+    for name, length in PATTERNS:
+        offsets[name] = size
+        size += 3 ** length
+
+    return offsets, size
+
+
+OFFSETS, PHASE_SIZE = init_offsets()
+
+REVERSE_BYTE = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+# Binary number of own (or opponent) discs -> base-3 digits
+TERNARY = [sum(3 ** i for i in range(10) if b >> i & 1) for b in range(1 << 10)]
+
+DIAG_GATHER = 0x0101010101010101
+
+
+def diagonal_mask(length):
+    """Diagonal of given length parallel to a1-h8 touching the top edge"""
+    mask = 0
+
+    for i in range(length):
+        mask |= 1 << (i * 8 + 8 - length + i)
+
+    return mask
+
+
+DIAG_MASKS = {length: diagonal_mask(length) for length in range(4, 9)}
+
+
+def flip_vertical(bb):
+    """Mirror board top <-> bottom"""
+    return int.from_bytes(bb.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(bb):
+    """Mirror board left <-> right"""
+    return int.from_bytes(bb.to_bytes(8, 'little').translate(REVERSE_BYTE), 'little')
+
+
+def transpose(bb):
+    """Mirror board along a1-h8 diagonal, (x, y) -> (y, x)"""
+    t = 0x0F0F0F0F00000000 & (bb ^ (bb << 28))
+    bb ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bb ^ (bb << 14))
+    bb ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bb ^ (bb << 7))
+    bb ^= t ^ (t >> 7)
+
+    return bb & 0xFFFFFFFFFFFFFFFF
+
+
+def symmetries(bb):
+    """Return the 8 symmetric images of a bitboard"""
+    v = flip_vertical(bb)
+    t = transpose(bb)
+    tv = flip_vertical(t)
+
+    return [bb, v, mirror_horizontal(bb), mirror_horizontal(v),
+            t, tv, mirror_horizontal(t), mirror_horizontal(tv)]
+
+
+def pattern_indices(own, opp):
+    """Return indices of all pattern instances inside a phase table"""
+    own_s = symmetries(own)
+    opp_s = symmetries(opp)
+    res = []
+
+    # Top edge and the top-left 2x5 block of every image
+    edge = OFFSETS['edge']
+    corner = OFFSETS['corner']
+
+    for i in (0, 1, 4, 5):
+        res.append(edge + TERNARY[own_s[i] & 0xFF] + 2 * TERNARY[opp_s[i] & 0xFF])
+
+    for o, p in zip(own_s, opp_s):
+        o = (o & 0x1F) | ((o >> 3) & 0x3E0)
+        p = (p & 0x1F) | ((p >> 3) & 0x3E0)
+        res.append(corner + TERNARY[o] + 2 * TERNARY[p])
+
+    # Both long diagonals, shorter ones have four instances
+    for length in range(4, 9):
+        mask = DIAG_MASKS[length]
+        offset = OFFSETS['diag%d' % length]
+        shift = 56 + 8 - length
+
+        for i in ((0, 2) if length == 8 else (0, 1, 2, 3)):
+            o = ((own_s[i] & mask) * DIAG_GATHER >> shift) & 0xFF
+            p = ((opp_s[i] & mask) * DIAG_GATHER >> shift) & 0xFF
+            res.append(offset + TERNARY[o] + 2 * TERNARY[p])
+
+    return res
+
+
+# Index of every instance on the empty board is the start of its table
+INSTANCE_OFFSETS = pattern_indices(0, 0)
+INSTANCE_PATTERNS = [{OFFSETS[name]: name for name, _ in PATTERNS}[o] for o in INSTANCE_OFFSETS]
+LENGTHS = dict(PATTERNS)
+
+
+def init_fields():
+    """
+    Instances read from one 16 bit field of PatternLogic.packed, small
+    diagonals are paired (at most 10 squares) so fewer tables are read
+    """
+    instances = {}
+
+    for k, name in enumerate(INSTANCE_PATTERNS):
+        instances.setdefault(name, []).append(k)
+
+    fields = [(k,) for name in ('edge', 'corner', 'diag8', 'diag7') for k in instances[name]]
+    fields += zip(instances['diag6'], instances['diag4'])
+    fields += zip(instances['diag5'][0::2], instances['diag5'][1::2])
+
+    return fields
+
+
+FIELDS = init_fields()
+
+
+def pack(own, opp):
+    """Field indices of a position packed into one integer, 16 bits per field"""
+    indices = [index - offset for index, offset in zip(pattern_indices(own, opp), INSTANCE_OFFSETS)]
+    packed = 0
+
+    for k, field in enumerate(FIELDS):
+        value = 0
+
+        for i in field:
+            value = value * 3 ** LENGTHS[INSTANCE_PATTERNS[i]] + indices[i]
+
+        packed |= value << (16 * k)
+
+    return packed
+
+
+# Packed change when a disc of the first (second) player is put on a square,
+# own digit is 1 and opponent digit 2 so a flip changes a digit by one
+SQUARE_DELTAS = [pack(1 << sq, 0) for sq in range(64)]
+PLACE_DELTAS = [SQUARE_DELTAS, [2 * delta for delta in SQUARE_DELTAS]]
+
+BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def phase_of(own, opp, n_phases):
+    """Game phase bucket by number of discs on the board"""
+    return min((popcount(own | opp) - 4) * n_phases // 60, n_phases - 1)
+
+
+class PatternLogic(BitboardLogic):
+    def __init__(self):
+        """Board constructor, indices are read from the first player's side"""
+        super().__init__()
+        self.packed = pack(self.discs[0], self.discs[1])
+
+    def quick_copy(self) -> "PatternLogic":
+        new = super().quick_copy()
+        new.packed = self.packed
+        return new
+
+    def do_move(self, move, turn):
+        """Apply the move, updating field indices with the Zobrist key"""
+        self.move_list.append(move)
+
+        if move is None:
+            self.history.append((turn, 0, 0, self.hash, self.packed))
+            self.hash ^= ZOBRIST_SIDE
+            return
+
+        x, y = move
+        sq = y * 8 + x
+        placed = 1 << sq
+        own = self.discs[turn]
+        opp = self.discs[1 - turn]
+
+        flipped = compute_flips(own, opp, sq)
+
+        self.discs[turn] = own | flipped | placed
+        self.discs[1 - turn] = opp ^ flipped
+
+        self.history.append((turn, placed, flipped, self.hash, self.packed))
+
+        key = self.hash ^ ZOBRIST_SIDE ^ ZOBRIST[turn][sq]
+        delta = 0
+
+        for f in bits_to_squares(flipped):
+            key ^= ZOBRIST_FLIP[f]
+            delta += SQUARE_DELTAS[f]
+
+        self.hash = key
+        self.packed += PLACE_DELTAS[turn][sq] + (delta if turn else -delta)
+
+    def undo_move(self):
+        """Undo the move"""
+        turn, placed, flipped, self.hash, self.packed = self.history.pop()
+        self.move_list.pop()
+
+        self.discs[turn] ^= flipped | placed
+        self.discs[1 - turn] ^= flipped
+
+
+class PatternWeights:
+    def __init__(self, weights, n_phases):
+        """Wrap flat weight sequence of n_phases * PHASE_SIZE values"""
+        self.weights = weights
+        self.n_phases = n_phases
+        # Table of every field, by number of discs on the board
+        self.tables = self.field_tables(weights, n_phases)
+
+    @staticmethod
+    def field_tables(weights, n_phases):
+        """Lists read by every field, paired instances get a joint list, for 0 - 64 discs"""
+        phases = []
+
+        for phase in range(n_phases):
+            base = phase * PHASE_SIZE
+            tables = {}
+
+            for name, length in PATTERNS:
+                start = base + OFFSETS[name]
+                tables[(name,)] = list(weights[start:start + 3 ** length])
+
+            for first, second in (('diag6', 'diag4'), ('diag5', 'diag5')):
+                tables[(first, second)] = [a + b for a in tables[(first,)] for b in tables[(second,)]]
+
+            phases.append([tables[tuple(INSTANCE_PATTERNS[i] for i in field)] for field in FIELDS])
+
+        return [phases[min(max(discs - 4, 0) * n_phases // 60, n_phases - 1)] for discs in range(65)]
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map weights stored by save()"""
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_phases = HEADER.unpack_from(data)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a pattern table' % path)
+
+        weights = memoryview(data)[HEADER.size:].cast('h')
+
+        # Stored little-endian, only big-endian hosts copy the table
+        if BIG_ENDIAN:
+            weights = array('h', weights)
+            weights.byteswap()
+
+        if len(weights) != n_phases * PHASE_SIZE:
+            raise ValueError('%s has unexpected size' % path)
+
+        return cls(weights, n_phases)
+
+    @staticmethod
+    def save(path, weights, n_phases):
+        """Store weights (in hundredths of a disc) as int16"""
+        clipped = [max(-32768, min(32767, int(round(w)))) for w in weights]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, n_phases))
+            f.write(struct.pack('<%dh' % len(clipped), *clipped))
+
+    def evaluate(self, own, opp):
+        """Expected final disc difference for owner of 'own' (hundredths)"""
+        weights = self.weights
+        base = phase_of(own, opp, self.n_phases) * PHASE_SIZE
+
+        return sum(weights[base + i] for i in pattern_indices(own, opp))
+
+    def evaluate_game(self, game: PatternLogic, player):
+        """Expected final disc difference for player (hundredths), from kept indices"""
+        black, white = game.discs
+        indices = array('H', game.packed.to_bytes(2 * len(FIELDS), 'little'))
+
+        if BIG_ENDIAN:
+            indices.byteswap()
+
+        score = sum(map(getitem, self.tables[(black | white).bit_count()], indices))
+
+        # Indices are read from the first player's side, the game is zero-sum
+        return score if player == 0 else -score
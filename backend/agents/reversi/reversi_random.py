@@ -88,10 +88,10 @@ class Logic:
             (-1, 1)
         ]
 
-        self.history.append([x[:] for x in self.board])
         self.move_list.append(move)
 
         if move is None:
+            self.history.append([])
             return
 
         x, y = move
@@ -100,6 +100,8 @@ class Logic:
         self.board[y][x] = turn
         self.free_fields -= {move}
 
+        flipped = []
+
         for dx, dy in directions:
             x, y = x0, y0
 
@@ -117,15 +119,27 @@ class Logic:
                 for (nx, ny) in to_beat:
                     self.board[ny][nx] = turn
 
+                flipped.extend(to_beat)
+
+        # Only flipped fields are recorded, undo costs O(flips)
+        self.history.append(flipped)
+
     def undo_move(self):
         """Undo the move"""
-        prev_board = self.history.pop()
+        flipped = self.history.pop()
         move = self.move_list.pop()
 
-        if move is not None:
-            self.free_fields.add(move)
+        if move is None:
+            return
+
+        x, y = move
+        turn = self.board[y][x]
+
+        self.board[y][x] = None
+        self.free_fields.add(move)
 
-        self.board = prev_board
+        for (nx, ny) in flipped:
+            self.board[ny][nx] = 1 - turn
 
     def result(self):
         """Check which site is winning"""
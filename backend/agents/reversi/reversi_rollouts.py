@@ -0,0 +1,137 @@
+""" reversi_rollouts.py
+
+Vectorized random rollouts for reversi MCTS. N games are kept as
+NumPy uint64 bitboard arrays (side to move / other side) and are
+advanced together, one ply per iteration, until all of them end.
+"""
+import numpy as np
+
+from backend.agents.reversi.reversi_bitboard import FULL, NOT_FILE_A, NOT_FILE_H, INNER
+
+U = np.uint64
+SQUARE_BITS = U(1) << np.arange(64, dtype=np.uint64)
+
+# (shift, mask applied after shifting), positive shift is to the left
+SHIFTS = [
+    (1, NOT_FILE_A),
+    (-1, NOT_FILE_H),
+    (8, FULL),
+    (-8, FULL),
+    (9, NOT_FILE_A),
+    (-9, NOT_FILE_H),
+    (7, NOT_FILE_H),
+    (-7, NOT_FILE_A),
+]
+
+SHIFTS = [(U(abs(n)), n > 0, U(mask)) for n, mask in SHIFTS]
+
+
+def shift(bb, amount, left, mask):
+    """Shift bitboards in one direction dropping wrapped squares"""
+    return ((bb << amount) if left else (bb >> amount)) & mask
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(bb):
+        """Count set bits of every bitboard"""
+        return np.bitwise_count(bb).astype(np.int64)
+else:
+    def popcount(bb):
+        """Count set bits of every bitboard"""
+        return np.unpackbits(bb.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def generate_moves(own, opp):
+    """Legal move bitboards for every game"""
+    empty = ~(own | opp)
+    inner = opp & U(INNER)
+    moves = np.zeros_like(own)
+
+    for amount, left, mask in SHIFTS:
+        # Vertical lines cannot wrap, others must not run over the edge files
+        line = opp if amount == 8 else inner
+        t = line & shift(own, amount, left, mask)
+
+        for _ in range(5):
+            t |= line & shift(t, amount, left, mask)
+
+        moves |= shift(t, amount, left, mask)
+
+    return moves & empty
+
+
+def compute_flips(own, opp, placed):
+    """Discs flipped by placing 'placed' for every game"""
+    flipped = np.zeros_like(own)
+
+    for amount, left, mask in SHIFTS:
+        run = shift(placed, amount, left, mask) & opp
+
+        for _ in range(5):
+            run |= shift(run, amount, left, mask) & opp
+
+        closed = (shift(run, amount, left, mask) & own) != 0
+        flipped |= np.where(closed, run, U(0))
+
+    return flipped
+
+
+def pick_random(moves, rng):
+    """Bitboard with one uniformly chosen legal move for every game"""
+    legal = (moves[:, None] & SQUARE_BITS) != 0
+    keys = np.where(legal, rng.random(legal.shape), -1.0)
+
+    return SQUARE_BITS[keys.argmax(axis=1)]
+
+
+def batch_simulate(jobs, rng=None, record=False):
+    """
+    Play every (state, player) job to the end with random moves.
+    Returns array of Logic.result() values (discs of 1 minus discs of 0).
+    With record set also returns (N, 2) array of bitboards of squares
+    placed by player 0 and player 1 of every game.
+    """
+    rng = rng or np.random.default_rng()
+
+    own = np.array([state.discs[player] for state, player in jobs], dtype=np.uint64)
+    opp = np.array([state.discs[1 - player] for state, player in jobs], dtype=np.uint64)
+    turn = np.array([player for _, player in jobs], dtype=np.int8)
+    passes = np.array([min(state.passes, 2) for state, _ in jobs], dtype=np.int8)
+
+    played = np.zeros((len(jobs), 2), dtype=np.uint64)
+    active = np.flatnonzero((passes < 2) & (~(own | opp) != 0))
+
+    while active.size:
+        o, p = own[active], opp[active]
+        moves = generate_moves(o, p)
+        can_move = moves != 0
+
+        placed = np.zeros_like(o)
+        idx = np.flatnonzero(can_move)
+
+        if idx.size:
+            placed[idx] = pick_random(moves[idx], rng)
+
+        flipped = compute_flips(o, p, placed)
+
+        if record:
+            played[active, turn[active]] |= placed
+
+        # Sides are swapped, a pass only swaps them
+        own[active] = p ^ flipped
+        opp[active] = o | flipped | placed
+        turn[active] ^= 1
+        passes[active] = np.where(can_move, 0, passes[active] + 1)
+
+        done = (passes[active] >= 2) | (~(own[active] | opp[active]) == 0)
+        active = active[~done]
+
+    # own belongs to player 'turn'
+    diff = popcount(own) - popcount(opp)
+
+    results = np.where(turn == 1, diff, -diff)
+
+    if record:
+        return results, played
+
+    return results
@@ -0,0 +1,176 @@
+""" train_patterns.py
+
+Offline tool building pattern tables for reversi_patterns.py.
+Plays self-play games between ReversiAlfaAgent instances (opening
+moves are random for variety), then fits pattern weights with
+stochastic gradient descent, phase by phase from the last one. The
+last phase learns the final disc difference, earlier phases learn the
+evaluation of the first position of the next phase in the same game,
+which is far less noisy than a result decided many moves later.
+
+Games can be kept in a file (--games-file) to fit again without
+playing them.
+
+Run from repository root:
+python -m backend.agents.reversi.train_patterns --games 2000
+
+Tables are written to data/reversi_patterns.bin unless --out is given,
+ReversiAlfaAgent uses them with patterns_path=PATTERNS_PATH.
+"""
+import io
+import os
+import json
+import random
+import argparse
+import contextlib
+
+from backend.agents.reversi.reversi_alfa_beta import ReversiAlfaAgent
+from backend.agents.reversi.reversi_patterns import (
+    PatternWeights, pattern_indices, phase_of, PHASE_SIZE, SCALE, PATTERNS_PATH
+)
+
+
+def self_play(games, move_time, random_plies, seed):
+    """Return [(positions, final disc difference)], positions are (first, second) player discs"""
+    rng = random.Random(seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        agents = [ReversiAlfaAgent(move_time=move_time) for _ in range(2)]
+
+    played = []
+
+    for g in range(games):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for player, agent in enumerate(agents):
+                agent.reset()
+                agent.my_player = player
+
+        game = agents[0].game
+        positions = []
+        player = 0
+
+        while not game.terminal():
+            moves = game.moves(player)
+
+            if not moves:
+                move = None
+            elif len(game.move_list) < random_plies:
+                move = rng.choice(moves)
+            else:
+                move = agents[player].best_move(moves)
+
+            for agent in agents:
+                agent.game.do_move(move, player)
+
+            positions.append((game.discs[0], game.discs[1]))
+            player = 1 - player
+
+        # result() counts for the second player
+        result = -game.result()
+        played.append((positions, result))
+
+        print('game %d/%d result %d' % (g + 1, games, result))
+
+    return played
+
+
+def load_games(path):
+    """Read games stored by store_games()"""
+    with open(path) as f:
+        return [(list(map(tuple, game['positions'])), game['result']) for game in map(json.loads, f)]
+
+
+def store_games(path, games):
+    """Write games as JSON lines"""
+    with open(path, 'w') as f:
+        for positions, result in games:
+            f.write(json.dumps({'positions': positions, 'result': result}) + '\n')
+
+
+def evaluate(weights, first, second, n_phases):
+    """Evaluation (in discs) for the first player"""
+    base = phase_of(first, second, n_phases) * PHASE_SIZE
+
+    return sum(weights[base + i] for i in pattern_indices(first, second))
+
+
+def phase_samples(games, weights, phase, n_phases):
+    """Return [(weight indices, target)] of positions in the phase"""
+    base = phase * PHASE_SIZE
+    data = []
+
+    for positions, result in games:
+        target = result
+
+        # Walk back from the end, target is the result or the next phase
+        for t in range(len(positions) - 1, -1, -1):
+            first, second = positions[t]
+            position_phase = phase_of(first, second, n_phases)
+
+            if position_phase < phase:
+                break
+
+            if position_phase == phase:
+                # Every position is used from both sides
+                data.append(([base + i for i in pattern_indices(first, second)], target))
+                data.append(([base + i for i in pattern_indices(second, first)], -target))
+            else:
+                target = evaluate(weights, first, second, n_phases)
+
+    return data
+
+
+def fit(games, n_phases, epochs, rate, seed):
+    """Fit weights (in discs) with stochastic gradient descent, last phase first"""
+    rng = random.Random(seed)
+    weights = [0.0] * (n_phases * PHASE_SIZE)
+
+    for phase in range(n_phases - 1, -1, -1):
+        data = phase_samples(games, weights, phase, n_phases)
+
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            loss = 0.0
+
+            for indices, target in data:
+                error = target - sum(weights[i] for i in indices)
+                loss += error * error
+                step = rate * error / len(indices)
+
+                for i in indices:
+                    weights[i] += step
+
+            print('phase %d epoch %d/%d mse %.2f' % (phase, epoch + 1, epochs, loss / max(len(data), 1)))
+
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build reversi pattern tables')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--move-time', type=float, default=0.05)
+    parser.add_argument('--random-plies', type=int, default=12)
+    parser.add_argument('--phases', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=337942)
+    parser.add_argument('--out', default=PATTERNS_PATH)
+    parser.add_argument('--games-file', help='read games from this file if it exists, else store them there')
+    args = parser.parse_args()
+
+    if args.games_file and os.path.exists(args.games_file):
+        games = load_games(args.games_file)
+    else:
+        games = self_play(args.games, args.move_time, args.random_plies, args.seed)
+
+        if args.games_file:
+            store_games(args.games_file, games)
+
+    weights = fit(games, args.phases, args.epochs, args.rate, args.seed)
+
+    PatternWeights.save(args.out, [w * SCALE for w in weights], args.phases)
+    print('saved %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
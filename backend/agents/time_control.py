@@ -0,0 +1,62 @@
+""" time_control.py
+
+Per-move and per-game time budgets for the searching agents.
+"""
+import time
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the move deadline has passed"""
+    pass
+
+
+class TimeControl:
+    def __init__(self, move_time=1.0, game_time=None, reserve=0.1):
+        """
+        move_time - upper bound for a single move (seconds)
+        game_time - total time for all our moves in a game, None for no clock
+        reserve - part of the game clock which is never spent
+        """
+        self.move_time = move_time
+        self.game_time = game_time
+        self.reserve = reserve
+        self.remaining = game_time
+        self.started = None
+        self.deadline = None
+
+    def reset(self):
+        """Start a new game"""
+        self.remaining = self.game_time
+
+    def start(self, moves_left=1):
+        """Start the clock for one move and set its deadline"""
+        budget = self.move_time
+
+        if self.remaining is not None:
+            spare = max(self.remaining - self.reserve, 0.0)
+            budget = min(budget, spare / max(moves_left, 1))
+
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget
+
+    def elapsed(self):
+        """Time spent on the current move"""
+        return time.perf_counter() - self.started
+
+    def budget(self):
+        """Time granted to the current move"""
+        return self.deadline - self.started
+
+    def check(self):
+        """Abort the search if the deadline has passed"""
+        if time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def stop(self):
+        """Charge the time spent on this move to the game clock"""
+        spent = self.elapsed()
+
+        if self.remaining is not None:
+            self.remaining -= spent
+
+        return spent
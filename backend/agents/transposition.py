@@ -0,0 +1,52 @@
+""" transposition.py
+
+Bounded transposition table and Zobrist helpers shared
+by the alfa-beta agents.
+"""
+import random
+
+# Bound types of stored scores
+EXACT, LOWER, UPPER = range(3)
+
+
+def zobrist_keys(count, seed):
+    """Generate 'count' reproducible random 64-bit keys"""
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+class TranspositionTable:
+    def __init__(self, size=1 << 18):
+        """Table constructor, size is rounded down to a power of two"""
+        size = 1 << (size.bit_length() - 1)
+
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.age = 0
+
+    def clear(self):
+        """Forget all stored positions"""
+        self.slots = [None] * (self.mask + 1)
+        self.age = 0
+
+    def new_search(self):
+        """Mark entries from previous searches as replaceable"""
+        self.age += 1
+
+    def get(self, key):
+        """Return (key, depth, flag, score, move, age) entry or None"""
+        entry = self.slots[key & self.mask]
+
+        if entry is not None and entry[0] == key:
+            return entry
+
+        return None
+
+    def put(self, key, depth, flag, score, move):
+        """Store search result using depth-preferred replacement"""
+        idx = key & self.mask
+        entry = self.slots[idx]
+
+        # Keep deeper results of the current search, anything else is evicted
+        if entry is None or entry[1] <= depth or entry[5] != self.age:
+            self.slots[idx] = (key, depth, flag, score, move, self.age)
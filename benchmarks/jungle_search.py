@@ -0,0 +1,263 @@
+""" jungle_search.py
+
+Benchmark of the jungle alfa-beta search. Searches a fixed suite of
+positions to a fixed depth with the principal variation search of
+JungleAlfaAgent and with the previous max/min search, whose minimizing
+branch lowered alfa instead of tightening beta, and reports nodes
+and time of both.
+
+Run from repository root: python -m benchmarks.jungle_search [depth]
+"""
+import io
+import sys
+import time
+import random
+import contextlib
+
+from backend.agents.jungle.jungle_board import ArrayLogic
+from backend.agents.jungle.jungle_alfa_beta import (
+    JungleAlfaAgent, QUIESCENCE_DEPTH, EXACT, LOWER, UPPER
+)
+
+
+class LegacyJungleAgent(JungleAlfaAgent):
+    """Max/min search as it was before the negamax rewrite"""
+
+    def quiescence(self, game: ArrayLogic, alfa, beta, is_maximizing, depth):
+        """Resolve captures and den threats left at the horizon"""
+        self.nodes += 1
+
+        if not self.nodes & 255:
+            self.clock.check()
+
+        if game.victory(self.my_player) or game.victory(1 - self.my_player):
+            return self.evaluate(game)
+
+        # Side to move may also decline all tactical moves
+        best_score = self.evaluate(game)
+
+        if depth == 0:
+            return best_score
+
+        player = self.my_player if is_maximizing else 1 - self.my_player
+
+        if is_maximizing:
+            if best_score >= beta:
+                return best_score
+
+            alfa = max(alfa, best_score)
+        else:
+            if best_score <= alfa:
+                return best_score
+
+            beta = min(beta, best_score)
+
+        moves = game.tactical_moves(player)
+        self.order_moves(game, moves, player, None)
+
+        for move in moves:
+            game.do_move(move)
+            score = self.quiescence(game, alfa, beta, not is_maximizing, depth - 1)
+            game.undo_move()
+
+            if is_maximizing:
+                best_score = max(best_score, score)
+                alfa = max(alfa, best_score)
+            else:
+                best_score = min(best_score, score)
+                beta = min(beta, best_score)
+
+            if beta <= alfa:
+                break
+
+        return best_score
+
+    def minimax(self, game: ArrayLogic, depth, alfa, beta, is_maximizing):
+        """Search on one mutable state with transposition table"""
+        if depth == 0:
+            return self.quiescence(game, alfa, beta, is_maximizing, QUIESCENCE_DEPTH)
+
+        self.nodes += 1
+
+        if not self.nodes & 255:
+            self.clock.check()
+
+        if game.victory(self.my_player) or game.victory(1 - self.my_player):
+            return self.evaluate(game)
+
+        key = game.search_key(depth + QUIESCENCE_DEPTH)
+        entry = self.tt.get(key)
+        hash_move = None
+
+        if entry is not None:
+            _, tt_depth, flag, tt_score, hash_move, _ = entry
+
+            if tt_depth >= depth:
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER:
+                    alfa = max(alfa, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+
+                if beta <= alfa:
+                    return tt_score
+
+        player = self.my_player if is_maximizing else 1 - self.my_player
+
+        best_score = -float('inf') if is_maximizing else float('inf')
+        best_move = None
+
+        moves = game.moves(player)
+        self.order_moves(game, moves, player, hash_move)
+
+        alfa_orig, beta_orig = alfa, beta
+
+        if is_maximizing:
+            for move in moves:
+                game.do_move(move)
+                score = self.minimax(game, depth - 1, alfa, beta, not is_maximizing)
+                game.undo_move()
+
+                if score > best_score or best_move is None:
+                    best_score = score
+                    best_move = move
+
+                alfa = max(alfa, best_score)
+
+                if beta <= alfa:
+                    break
+        else:
+            for move in moves:
+                game.do_move(move)
+                score = self.minimax(game, depth - 1, alfa, beta, not is_maximizing)
+                game.undo_move()
+
+                if score < best_score or best_move is None:
+                    best_score = score
+                    best_move = move
+
+                alfa = min(alfa, best_score)
+
+                if beta <= alfa:
+                    break
+
+        if best_score <= alfa_orig:
+            flag = UPPER
+        elif best_score >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+
+        self.tt.put(key, depth, flag, best_score, best_move)
+
+        return best_score
+
+    def search_root(self, moves, depth, scores):
+        """Search root moves to given depth, fill scores and return (best move, score)"""
+        game = self.game
+        best_score = -float('inf')
+        best_move = None
+
+        for move in moves:
+            game.do_move(move)
+            # Moves that cannot beat best_score are cut early
+            score = self.minimax(game, depth - 1, best_score, float('inf'), False)
+            game.undo_move()
+
+            scores[move] = score
+
+            if score > best_score or best_move is None:
+                best_score = score
+                best_move = move
+
+        self.tt.put(game.search_key(depth + QUIESCENCE_DEPTH), depth, EXACT, best_score, best_move)
+
+        return best_move, best_score
+
+
+def position_suite(count=20, seed=337942):
+    """Generate positions by seeded random play, returns move lists"""
+    rng = random.Random(seed)
+    suite = []
+
+    while len(suite) < count:
+        game = ArrayLogic()
+        player = 0
+        move_list = []
+
+        for _ in range(rng.randint(6, 60)):
+            moves = game.moves(player)
+
+            if not moves or game.terminal():
+                break
+
+            move = rng.choice(moves)
+            game.do_move(move)
+            move_list.append(move)
+            player = 1 - player
+
+        if not game.terminal() and game.moves(player):
+            suite.append((move_list, player))
+
+    return suite
+
+
+def make_agent(cls):
+    """Create agent without talking to stdout"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = cls(move_time=float('inf'))
+
+    return agent
+
+
+def run(suite, depth, cls):
+    """Search every position, returns (nodes, seconds)"""
+    agent = make_agent(cls)
+    nodes = 0
+    seconds = 0.0
+
+    for move_list, player in suite:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.reset()
+
+        for move in move_list:
+            agent.game.do_move(move)
+
+        agent.my_player = player
+        agent.nodes = 0
+        agent.clock.start()
+
+        moves = agent.game.moves(player)
+        agent.order_moves(agent.game, moves, player, None)
+
+        start = time.perf_counter()
+
+        if cls is LegacyJungleAgent:
+            agent.search_root(moves, depth, {})
+        else:
+            agent.search_root(moves, depth, -float('inf'), float('inf'), {})
+
+        seconds += time.perf_counter() - start
+        nodes += agent.nodes
+
+    return nodes, seconds
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    suite = position_suite()
+
+    print('depth %d, %d positions' % (depth, len(suite)))
+
+    legacy_nodes, legacy_time = run(suite, depth, LegacyJungleAgent)
+    nodes, seconds = run(suite, depth, JungleAlfaAgent)
+
+    print('legacy max/min  nodes=%-9d time=%.2fs' % (legacy_nodes, legacy_time))
+    print('negamax PVS     nodes=%-9d time=%.2fs' % (nodes, seconds))
+    print('nodes reduced %.1f%%, speedup %.1fx' % (
+        100.0 * (1 - nodes / legacy_nodes), legacy_time / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+""" reversi_mcts_parallel.py
+
+Benchmark of parallel MCTS for reversi. Measures rounds per second
+of the serial search and of root and leaf parallelization for an
+increasing number of worker processes. The serial search simulates
+leaves in batches like a root parallel worker does, so the speedup
+shows how the search scales with workers.
+
+Run from repository root: python -m benchmarks.reversi_mcts_parallel [rounds]
+"""
+import os
+import sys
+import time
+import random
+
+from backend.agents.reversi.reversi_bitboard import BitboardLogic
+from backend.agents.reversi.reversi_mcts import MCTS, ParallelMCTS, ROLLOUT_BATCH
+
+
+def position(plies=16, seed=337942):
+    """Midgame position reached by seeded random play"""
+    rng = random.Random(seed)
+    state = BitboardLogic()
+    player = 0
+
+    for _ in range(plies):
+        moves = state.moves(player)
+        state.do_move(rng.choice(moves) if moves else None, player)
+        player = 1 - player
+
+    return state, player
+
+
+def rate(mcts, state, player, rounds):
+    """Rounds per second of a single search"""
+    mcts.reset()
+    mcts.set_root(state, player)
+
+    start = time.perf_counter()
+    mcts.run(rounds)
+
+    return rounds / (time.perf_counter() - start)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    state, player = position()
+    cpus = os.cpu_count()
+
+    workers = [1]
+    while workers[-1] * 2 <= cpus:
+        workers.append(workers[-1] * 2)
+
+    serial = rate(MCTS(batch=ROLLOUT_BATCH), state, player, rounds)
+    print('%d cpus, %d rounds' % (cpus, rounds))
+
+    if cpus == 1:
+        print('one cpu only, scaling cannot be measured here')
+
+    print('serial            %8.0f rounds/s' % serial)
+
+    for mode in ('root', 'leaf'):
+        for n in workers:
+            mcts = ParallelMCTS(n, mode)
+            # Warm up the pool so process start is not measured
+            rate(mcts, state, player, n * 8)
+            r = rate(mcts, state, player, rounds)
+            mcts.close()
+
+            print('%-4s workers=%-3d %8.0f rounds/s  speedup %.2f' % (mode, n, r, r / serial))
+
+
+if __name__ == '__main__':
+    main()
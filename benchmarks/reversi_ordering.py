@@ -0,0 +1,107 @@
+""" reversi_ordering.py
+
+Benchmark of move ordering in ReversiAlfaAgent. Searches a fixed
+suite of positions to a fixed depth with and without the ordering
+layer and reports nodes, effective branching factor and the share
+of cutoffs produced by the first move.
+
+Run from repository root: python -m benchmarks.reversi_ordering
+"""
+import io
+import sys
+import random
+import contextlib
+
+from backend.agents.reversi.reversi_alfa_beta import ReversiAlfaAgent
+
+
+def position_suite(count=20, seed=337942):
+    """Generate positions by seeded random play, returns move lists"""
+    rng = random.Random(seed)
+    agent = make_agent()
+    suite = []
+
+    while len(suite) < count:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.reset()
+
+        game = agent.game
+        player = 0
+        plies = rng.randint(8, 44)
+
+        for _ in range(plies):
+            moves = game.moves(player)
+            game.do_move(rng.choice(moves) if moves else None, player)
+            player = 1 - player
+
+        if not game.terminal() and game.moves(player):
+            suite.append((list(game.move_list), player))
+
+    return suite
+
+
+def make_agent():
+    """Create agent without talking to stdout"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = ReversiAlfaAgent(move_time=float('inf'))
+
+    return agent
+
+
+def run(suite, depth, ordering):
+    """Search every position, returns (nodes, cutoffs, first cutoffs, ebf)"""
+    agent = make_agent()
+    agent.ordering = ordering
+
+    nodes = cutoffs = first_cutoffs = 0
+    ebf = 0.0
+
+    for move_list, player in suite:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.reset()
+
+        for i, move in enumerate(move_list):
+            agent.game.do_move(move, i % 2)
+
+        agent.my_player = player
+        agent.nodes = agent.cutoffs = agent.first_cutoffs = 0
+        agent.clock.start()
+
+        moves = agent.game.moves(player)
+
+        if ordering:
+            agent.order_moves(moves, player, None)
+
+        agent.search_root(moves, depth, {})
+
+        nodes += agent.nodes
+        cutoffs += agent.cutoffs
+        first_cutoffs += agent.first_cutoffs
+        ebf += agent.nodes ** (1 / depth)
+
+    return nodes, cutoffs, first_cutoffs, ebf / len(suite)
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    suite = position_suite()
+
+    print('depth %d, %d positions' % (depth, len(suite)))
+
+    results = {}
+
+    for ordering in (False, True):
+        nodes, cutoffs, first, ebf = run(suite, depth, ordering)
+        results[ordering] = (nodes, ebf)
+
+        print('ordering=%-5s nodes=%-9d ebf=%.2f first-move cutoffs=%.1f%%' % (
+            ordering, nodes, ebf, 100.0 * first / max(cutoffs, 1)))
+
+    (nodes_off, ebf_off), (nodes_on, ebf_on) = results[False], results[True]
+
+    print('nodes reduced %.1f%%, branching factor %.2f -> %.2f' % (
+        100.0 * (1 - nodes_on / nodes_off), ebf_off, ebf_on))
+
+
+if __name__ == '__main__':
+    main()
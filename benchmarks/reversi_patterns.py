@@ -0,0 +1,174 @@
+""" reversi_patterns.py
+
+Benchmark of the pattern evaluation in ReversiAlfaAgent against the mask
+evaluation. Reports the cost of a leaf (do_move, evaluate, undo_move)
+over a fixed suite of positions and nodes per second of a fixed depth
+search, which also depends on the shape of the tree. Then plays a match
+between the two with colours alternated and seeded random openings.
+
+Needs a table built by train_patterns.py.
+
+Run from repository root:
+python -m benchmarks.reversi_patterns [games] [move time] [table path]
+"""
+import io
+import os
+import sys
+import time
+import random
+import timeit
+import contextlib
+
+from backend.agents.reversi.reversi_alfa_beta import ReversiAlfaAgent
+from backend.agents.reversi.reversi_patterns import PATTERNS_PATH
+
+# Random plies opening every match game
+OPENING_PLIES = 8
+
+
+def make_agent(patterns_path, move_time=float('inf')):
+    """Create agent without talking to stdout"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = ReversiAlfaAgent(move_time=move_time, patterns_path=patterns_path)
+
+    return agent
+
+
+def reset(agent, player):
+    """Start a new game as player"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent.reset()
+
+    agent.my_player = player
+
+
+def position_suite(count=20, seed=337942):
+    """Generate positions by seeded random play, returns move lists"""
+    rng = random.Random(seed)
+    agent = make_agent(None)
+    suite = []
+
+    while len(suite) < count:
+        reset(agent, 0)
+        game = agent.game
+        player = 0
+
+        for _ in range(rng.randint(8, 44)):
+            moves = game.moves(player)
+            game.do_move(rng.choice(moves) if moves else None, player)
+            player = 1 - player
+
+        if not game.terminal() and game.moves(player):
+            suite.append((list(game.move_list), player))
+
+    return suite
+
+
+def node_cost(agent, player, repeat=5, number=2000):
+    """Microseconds of do_move, evaluate and undo_move of one child, best of repeats"""
+    game = agent.game
+    moves = game.moves(player)
+
+    def children():
+        for move in moves:
+            game.do_move(move, player)
+            agent.evaluate()
+            game.undo_move()
+
+    return min(timeit.repeat(children, number=number, repeat=repeat)) / (number * len(moves)) * 1e6
+
+
+def speed(suite, patterns_path, depth):
+    """Return (nodes per second, microseconds per leaf)"""
+    agent = make_agent(patterns_path)
+    nodes = 0
+    search_time = cost = 0.0
+
+    for move_list, player in suite:
+        reset(agent, player)
+
+        for i, move in enumerate(move_list):
+            agent.game.do_move(move, i % 2)
+
+        cost += node_cost(agent, player)
+
+        agent.nodes = 0
+        agent.clock.start()
+
+        moves = agent.game.moves(player)
+        agent.order_moves(moves, player, None)
+
+        start = time.perf_counter()
+        agent.search_root(moves, depth, {})
+        search_time += time.perf_counter() - start
+        nodes += agent.nodes
+
+    return nodes / search_time, cost / len(suite)
+
+
+def play(agents, seed):
+    """Play one game, agents[0] moves first. Returns final disc difference for agents[0]"""
+    rng = random.Random(seed)
+
+    for player, agent in enumerate(agents):
+        reset(agent, player)
+
+    game = agents[0].game
+    player = 0
+
+    while not game.terminal():
+        moves = game.moves(player)
+
+        if not moves:
+            move = None
+        elif len(game.move_list) < OPENING_PLIES:
+            move = rng.choice(moves)
+        else:
+            move = agents[player].best_move(moves)
+
+        for agent in agents:
+            agent.game.do_move(move, player)
+
+        player = 1 - player
+
+    # result() counts for the second player
+    return -game.result()
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    move_time = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    path = sys.argv[3] if len(sys.argv) > 3 else PATTERNS_PATH
+
+    if not os.path.exists(path):
+        print('%s not found, build it with python -m backend.agents.reversi.train_patterns' % path)
+        return
+
+    suite = position_suite()
+
+    for name, patterns_path in (('mask', None), ('patterns', path)):
+        nps, cost = speed(suite, patterns_path, 4)
+        print('%-8s %8.0f nodes/s  %5.2f us per do_move, evaluate, undo_move' % (name, nps, cost))
+
+    patterns = make_agent(path, move_time)
+    mask = make_agent(None, move_time)
+    wins = draws = losses = discs = 0
+
+    # Every opening is played with both colours
+    for g in range(games):
+        if g % 2 == 0:
+            diff = play([patterns, mask], g // 2)
+        else:
+            diff = -play([mask, patterns], g // 2)
+
+        wins += diff > 0
+        draws += diff == 0
+        losses += diff < 0
+        discs += diff
+
+    print('patterns vs mask, %d games at %.2fs per move: +%d =%d -%d, disc difference %+d' % (
+        games, move_time, wins, draws, losses, discs))
+
+
+if __name__ == '__main__':
+    main()
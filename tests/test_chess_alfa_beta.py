@@ -0,0 +1,81 @@
+""" test_chess_alfa_beta.py
+
+Tests of the position key kept by the chess alfa-beta agent.
+
+Run from repository root: python -m pytest tests
+"""
+import random
+
+import chess
+import pytest
+from chess import polyglot
+
+from backend.agents.chess.chess_alfa_beta import ChessRandomAgent
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Agent without the opening book, which is not part of the repository"""
+    monkeypatch.setattr(polyglot, 'open_reader', lambda path: None)
+
+    return ChessRandomAgent()
+
+
+def play(agent, ucis):
+    """Register moves given in UCI notation"""
+    for uci in ucis.split():
+        assert chess.Move.from_uci(uci) in agent.board.legal_moves
+        agent.register(uci)
+
+
+def test_key_matches_polyglot_in_random_games(agent):
+    """Key equals polyglot.zobrist_hash after every push and pop"""
+    rng = random.Random(337942)
+
+    for _ in range(20):
+        agent.reset()
+        keys = []
+
+        while not agent.board.is_game_over() and len(keys) < 300:
+            keys.append(agent.position_key())
+            agent.push(rng.choice(list(agent.board.legal_moves)))
+
+            assert agent.position_key() == polyglot.zobrist_hash(agent.board)
+
+        while keys:
+            agent.pop()
+
+            assert agent.position_key() == keys.pop()
+
+
+@pytest.mark.parametrize('ucis', [
+    # Castling on both sides
+    'e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 e1g1 d7d6 d2d3 c8g4 b1c3 d8d7 c1e3 e8c8',
+    # En passant capture, then a position where it would be possible but is not played
+    'e2e4 a7a6 e4e5 d7d5 e5d6 a6a5 h2h4 g7g5',
+    # Promotion with capture
+    'b2b4 a7a5 b4a5 b7b6 a5b6 h7h6 b6c7 h6h5 c7d8n',
+])
+def test_key_matches_polyglot_in_special_moves(agent, ucis):
+    """Castling, en passant and promotions update the key"""
+    play(agent, ucis)
+
+    assert agent.position_key() == polyglot.zobrist_hash(agent.board)
+
+
+def test_move_orders_reach_the_same_key(agent):
+    """Transpositions share the key"""
+    play(agent, 'g1f3 b8c6 b1c3 g8f6')
+    key = agent.position_key()
+
+    agent.reset()
+    play(agent, 'b1c3 g8f6 g1f3 b8c6')
+
+    assert agent.position_key() == key
+
+    # Knights back home give the start position again
+    agent.reset()
+    start = agent.position_key()
+    play(agent, 'g1f3 g8f6 f3g1 f6g8')
+
+    assert agent.position_key() == start
@@ -0,0 +1,42 @@
+""" test_reversi_mcts.py
+
+Tests of the root parallel MCTS search.
+
+Run from repository root: python -m pytest tests
+"""
+import time
+import threading
+
+from backend.agents.reversi.reversi_bitboard import BitboardLogic
+from backend.agents.reversi.reversi_mcts import ParallelMCTS
+
+
+def test_root_search_can_be_polled_and_stopped():
+    """Root mode search reports a move while running and returns on stop()"""
+    state = BitboardLogic()
+    mcts = ParallelMCTS(workers=2, mode='root', max_nodes=100000)
+    result = []
+
+    try:
+        search = threading.Thread(target=lambda: result.append(mcts.search(state, 0, time_budget=60)))
+        search.start()
+
+        deadline = time.perf_counter() + 30
+        move = None
+
+        while move is None and time.perf_counter() < deadline:
+            time.sleep(0.05)
+            move = mcts.best_move_so_far()
+
+        assert move in state.moves(0)
+
+        mcts.stop()
+        search.join(10)
+
+        assert not search.is_alive()
+        assert result[0] in state.moves(0)
+        assert sum(mcts.root_visits().values()) > 0
+
+    finally:
+        mcts.stop()
+        mcts.close()
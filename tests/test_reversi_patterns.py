@@ -0,0 +1,69 @@
+""" test_reversi_patterns.py
+
+Tests of the reversi pattern tables and of the indices kept by PatternLogic.
+
+Run from repository root: python -m pytest tests
+"""
+import random
+import struct
+
+import pytest
+
+from backend.agents.reversi.reversi_bitboard import BitboardLogic
+from backend.agents.reversi.reversi_patterns import (
+    PatternLogic, PatternWeights, PHASE_SIZE, HEADER, pack
+)
+
+
+@pytest.fixture(scope='module')
+def weights(tmp_path_factory):
+    """Random table stored and loaded back"""
+    rng = random.Random(337942)
+    values = [rng.randint(-3000, 3000) for _ in range(2 * PHASE_SIZE)]
+    path = str(tmp_path_factory.mktemp('patterns') / 'patterns.bin')
+    PatternWeights.save(path, values, 2)
+
+    return values, path, PatternWeights.load(path)
+
+
+def test_table_is_stored_little_endian(weights):
+    """Weights on disk are little-endian int16 whatever the host is"""
+    values, path, loaded = weights
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    assert list(struct.unpack_from('<%dh' % len(values), data, HEADER.size)) == values
+    assert list(loaded.weights) == values
+
+
+def test_kept_indices_match_the_board(weights):
+    """Indices and evaluation kept by do_move and undo_move equal the ones computed from scratch"""
+    _, _, loaded = weights
+    rng = random.Random(337942)
+
+    for _ in range(20):
+        game = PatternLogic()
+        plain = BitboardLogic()
+        player = 0
+        packed = []
+
+        while not game.terminal():
+            moves = game.moves(player)
+            move = rng.choice(moves) if moves else None
+            packed.append(game.packed)
+            game.do_move(move, player)
+            plain.do_move(move, player)
+            player = 1 - player
+
+            black, white = game.discs
+
+            assert game.hash == plain.hash
+            assert game.packed == pack(black, white)
+            assert loaded.evaluate_game(game, 0) == loaded.evaluate(black, white)
+            assert loaded.evaluate_game(game, 1) == -loaded.evaluate(black, white)
+
+        while packed:
+            game.undo_move()
+
+            assert game.packed == packed.pop()